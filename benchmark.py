@@ -0,0 +1,201 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from main import config, build_instance, build_optimizers
+from map_objects.mapmanager import MapManager
+from multistart import fresh_map, build_solution
+from solver_objects.algorithm import MinimumInsertions
+from solver_objects.combiners import VNDGLS
+from solver_objects.profiling import Profiler
+from solver_objects.solution import Solution
+
+SIZES = [100, 200, 500, 1000, 2000]
+MAX_DEMAND = 500  # initialize_nodes draws demands of 200 to 500 kg
+MIN_REPEAT = 3  # a median of fewer runs is one outlier away from a false regression
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    nodes: int
+    vehicles: int
+    seconds: float  # median of the timed repeats
+    spread: float  # (slowest - fastest) / median of the timed repeats, the timer noise of this benchmark
+    peak_memory: int  # bytes allocated at the peak of one extra traced run, on top of its setup
+    candidates: Optional[int] = None  # candidate moves of the traced run, for the neighbourhood scans
+    candidates_per_second: Optional[float] = None
+
+
+Setup = Callable[[Optional[Profiler]], Callable[[], object]]  # builds fresh state, returns the call to time
+
+
+def fleet_size(nodes: int) -> int:
+    """
+    Vehicles for an instance of the given size. While the total demand is at most the fleet capacity
+    minus one maximal demand per vehicle, some route can always take the next customer, so the
+    construction never runs out of room.
+    """
+    capacity = config.getint('OPTIONS', 'vehicle_capacity')
+    return math.ceil(nodes * MAX_DEMAND / (capacity - MAX_DEMAND))
+
+
+def measure(name: str, nodes: int, vehicles: int, setup: Setup, repeat: int) -> BenchmarkResult:
+    """Time repeat runs on fresh state, then trace one more run with a profiler for memory and candidates"""
+    if repeat < MIN_REPEAT:
+        raise ValueError(f"At least {MIN_REPEAT} repeats are needed for a median, got {repeat}")
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):  # the solvers print every step
+        for _ in range(repeat):
+            run = setup(None)
+            start_time = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start_time)
+
+        profiler = Profiler()
+        run = setup(profiler)
+        tracemalloc.start()
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    candidates = sum(counters.candidates for counters in profiler.operators.values()) or None
+    seconds = statistics.median(times)
+    return BenchmarkResult(name=name,
+                           nodes=nodes,
+                           vehicles=vehicles,
+                           seconds=seconds,
+                           spread=(max(times) - min(times)) / seconds,
+                           peak_memory=peak_memory,
+                           candidates=candidates,
+                           candidates_per_second=None if candidates is None else candidates / seconds)
+
+
+def benchmark_size(nodes: int, seed: int, repeat: int) -> List[BenchmarkResult]:
+    vehicles = fleet_size(nodes)
+    results = []
+
+    def setup_map(profiler: Optional[Profiler]):
+        instance_nodes, instance_vehicles = build_instance(seed, nodes, vehicles)
+        return lambda: MapManager(nodes=instance_nodes, vehicles=instance_vehicles)
+
+    results.append(measure('MapManager', nodes, vehicles, setup_map, repeat))
+
+    instance_nodes, instance_vehicles = build_instance(seed, nodes, vehicles)
+    template = MapManager(nodes=instance_nodes, vehicles=instance_vehicles)
+
+    def setup_construction(profiler: Optional[Profiler]):
+        node_map = fresh_map(template)
+        return MinimumInsertions(_map=node_map, solution=Solution(node_map)).run
+
+    results.append(measure('MinimumInsertions.run', nodes, vehicles, setup_construction, repeat))
+
+    node_map = fresh_map(template)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        MinimumInsertions(_map=node_map, solution=Solution(node_map)).run()
+    routes = [[node.id for node in vehicle.vehicle_route.node_sequence] for vehicle in node_map.vehicles]
+
+    for index, operator in enumerate(build_optimizers(build_solution(template, routes))):
+        def setup_scan(profiler: Optional[Profiler], index: int = index):
+            optimizer = build_optimizers(build_solution(template, routes))[index]
+            if profiler is not None:
+                optimizer.enable_profiling(profiler)
+            return optimizer.generate_solution_space
+
+        results.append(measure(f'{type(operator).__name__}.generate_solution_space', nodes, vehicles,
+                               setup_scan, repeat))
+
+    def setup_iteration(profiler: Optional[Profiler]):
+        solution = build_solution(template, routes)
+        search = VNDGLS(random_seed=seed, limit=1, solution=solution)
+        if profiler is not None:
+            search.enable_profiling(profiler)
+        for optimizer in build_optimizers(solution):
+            search.add_pipeline(optimizer)
+        return search.run
+
+    results.append(measure('VNDGLS iteration', nodes, vehicles, setup_iteration, repeat))
+    return results
+
+
+def compare(results: List[BenchmarkResult], baseline: dict, tolerance: float) -> List[str]:
+    """
+    Benchmarks slower or hungrier than the baseline by more than tolerance, as lines to print.
+    Timings also have to exceed the spread of the repeats of either run, so noisy small benchmarks are not flagged.
+    """
+    baseline_results = {(result['name'], result['nodes']): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        reference = baseline_results.get((result.name, result.nodes))
+        if reference is None:
+            continue
+        timer_noise = max(result.spread, reference['spread'])
+        for field, unit, noise in (('seconds', 's', timer_noise), ('peak_memory', 'B', 0)):
+            value, reference_value = getattr(result, field), reference[field]
+            if reference_value and value > reference_value * (1 + max(tolerance, noise)):
+                regressions.append(f"{result.name} at {result.nodes} nodes: {field} {value:.4g}{unit}, "
+                                   f"baseline {reference_value:.4g}{unit} ({value / reference_value - 1:+.0%})")
+    return regressions
+
+
+def environment() -> Dict[str, object]:
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'options': {key: config.get('OPTIONS', key) for key in ('batched', 'granular', 'cache_moves', 'selection')}}
+
+
+def parse_arguments(arguments: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Time the construction, the neighbourhood scans and a VNDGLS "
+                                                 "iteration on reproducible instances of growing size.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="numbers of customers")
+    parser.add_argument('--seed', type=int, default=config.getint('OPTIONS', 'RANDOM_SEED'))
+    parser.add_argument('--repeat', type=int, default=MIN_REPEAT,
+                        help=f"timed runs per benchmark, at least {MIN_REPEAT}, the median is reported")
+    parser.add_argument('--output', default='benchmark.json', help="results file")
+    parser.add_argument('--baseline', help="results file of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown over the baseline")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    options = parse_arguments(arguments)
+
+    results = []
+    for nodes in options.sizes:
+        for result in benchmark_size(nodes, options.seed, options.repeat):
+            results.append(result)
+            rate = '' if result.candidates_per_second is None else f", {result.candidates_per_second:,.0f} candidates/s"
+            print(f"{result.nodes:>5} nodes  {result.name:<45} {result.seconds:9.4f} s  "
+                  f"{result.peak_memory / 2 ** 20:9.1f} MiB{rate}", flush=True)
+
+    with open(options.output, 'w') as file:
+        json.dump({'seed': options.seed,
+                   'repeat': options.repeat,
+                   'environment': environment(),
+                   'results': [asdict(result) for result in results]}, file, indent=2)
+
+    if options.baseline is None:
+        return 0
+    with open(options.baseline) as file:
+        regressions = compare(results, json.load(file), options.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
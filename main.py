@@ -1,13 +1,18 @@
+import os
 import random
 import configparser
 import time
-from typing import List
+from typing import List, Optional, Tuple
 
 from map_objects.printer import Printer
-from solver_objects.algorithm import  MinimumInsertions
+from solver_objects.algorithm import MinimumInsertions, RegretInsertions
 from map_objects.mapmanager import MapManager
 from map_objects.node import Node, Vehicle
 from solver_objects.optimizer import SwapMoveOptimizer, ReLocatorOptimizer, TwoOptOptimizer
+from solver_objects.OptimizerABC import Optimizer, selection_policy
+from solver_objects.parallel import EvaluationPool
+from solver_objects.checkpoint import load_checkpoint
+from solver_objects.profiling import Profiler
 import solver_objects.combiners
 from solver_objects.solution import Solution
 
@@ -17,8 +22,8 @@ config = configparser.ConfigParser()
 config.read('config.ini')
 
 
-def initialize_nodes(home_depot: Node) -> List[Node]:
-    nodes_number = config.getint('OPTIONS', 'nodes')
+def initialize_nodes(home_depot: Node, nodes_number: Optional[int] = None) -> List[Node]:
+    nodes_number = nodes_number or config.getint('OPTIONS', 'nodes')
     nodes = [home_depot]
     for i in range(nodes_number):
         x = random.randint(0, 100)
@@ -34,9 +39,9 @@ def initialize_nodes(home_depot: Node) -> List[Node]:
     return nodes
 
 
-def initialize_vehicles(home_depot: Node) -> List[Vehicle]:
+def initialize_vehicles(home_depot: Node, num_of_vehicles: Optional[int] = None) -> List[Vehicle]:
     vehicle_speed = config.getint('OPTIONS', 'vehicle_speed')
-    num_of_vehicles = config.getint('OPTIONS', 'number_of_vehicles')
+    num_of_vehicles = num_of_vehicles or config.getint('OPTIONS', 'number_of_vehicles')
     vehicle_capacity = config.getint('OPTIONS', 'vehicle_capacity')
     unloading_time = config.getint('OPTIONS', 'unloading_time')
     vehicles = [Vehicle(_id=i, vehicle_speed=vehicle_speed,
@@ -48,41 +53,99 @@ def initialize_vehicles(home_depot: Node) -> List[Vehicle]:
     return vehicles
 
 
-def main(random_seed: int) -> None:
+def build_instance(random_seed: int, nodes_number: Optional[int] = None,
+                   num_of_vehicles: Optional[int] = None) -> Tuple[List[Node], List[Vehicle]]:
+    """Random nodes and vehicles of config.ini, or of the given size, the same seed always gives the same instance"""
     random.seed(random_seed)
     home_depot = Node(_id=0, x_cord=50, y_cord=50, demand=0, unloading_time=15)
     home_depot.has_been_visited = True
-    nodes = initialize_nodes(home_depot)
-    vehicles = initialize_vehicles(home_depot)
-
-    node_map = MapManager(nodes=nodes, vehicles=vehicles)
-    solution = Solution(node_map)
-
-    greedy_algo = MinimumInsertions(_map=node_map, solution=solution)
-    start_time = time.time()
-    greedy_algo.run()
-
-    solution.run_checks()
-    solution.compute_service_time()
-    #
-    printer = Printer(solution)
-    #
-    sw = SwapMoveOptimizer(solution)
-    rl = ReLocatorOptimizer(solution)
-    twoOpt = TwoOptOptimizer(solution)
-
-    GLS = solver_objects.combiners.VNDGLS(random_seed=1, limit=1000, solution=solution)
-    GLS.add_pipeline(sw)
-    GLS.add_pipeline(rl)
-    GLS.add_pipeline(twoOpt)
-    GLS.run()
+    nodes = initialize_nodes(home_depot, nodes_number)
+    vehicles = initialize_vehicles(home_depot, num_of_vehicles)
+
+    return nodes, vehicles
+
+
+def build_map(random_seed: int, nodes_number: Optional[int] = None, num_of_vehicles: Optional[int] = None) -> MapManager:
+    nodes, vehicles = build_instance(random_seed, nodes_number, num_of_vehicles)
+    return MapManager(nodes=nodes, vehicles=vehicles)
+
+
+def build_optimizers(solution: Solution, pool: Optional[EvaluationPool] = None) -> List[Optimizer]:
+    """Swap, relocation and TwoOpt operators with the neighbourhood options of config.ini"""
+    batched = config.getboolean('OPTIONS', 'batched')
+    granular = config.getint('OPTIONS', 'granular') or None  # 0 searches the full neighbourhood
+    cache_moves = config.getboolean('OPTIONS', 'cache_moves')
+    selection = config.get('OPTIONS', 'selection')  # best, first or top_k
+    k = config.getint('OPTIONS', 'top_k')  # moves kept by top_k
+    options = dict(batched=batched, granular=granular, cache_moves=cache_moves, pool=pool)
+    sw = SwapMoveOptimizer(solution, selection=selection_policy(selection, k), **options)
+    rl = ReLocatorOptimizer(solution, selection=selection_policy(selection, k), **options)
+    twoOpt = TwoOptOptimizer(solution, selection=selection_policy(selection, k), **options)
+
+    return [sw, rl, twoOpt]
+
+
+def solve(node_map: MapManager, gls_seed: int, pool: Optional[EvaluationPool] = None,
+          checkpoint_path: Optional[str] = None, resume: bool = False) -> Solution:
+    """
+    MinimumInsertions or regret-k construction followed by VNDGLS.
+    With a checkpoint path VNDGLS saves its state there periodically, resume carries on from the saved state.
+    VNDGLS also stops after time_limit seconds or stagnation_limit iterations without improvement, 0 turns either off.
+    With a profile path the counters of VNDGLS and its operators are written there as JSON.
+    """
+    solution = Solution(node_map, cross_check=config.getboolean('OPTIONS', 'cross_check'))
+
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is None:  # a resumed run gets its routes from the checkpoint
+        regret_k = config.getint('OPTIONS', 'regret_k')  # 0 builds with MinimumInsertions
+        if regret_k:
+            greedy_algo = RegretInsertions(_map=node_map, solution=solution, k=regret_k,
+                                           workers=config.getint('OPTIONS', 'workers'))
+        else:
+            greedy_algo = MinimumInsertions(_map=node_map, solution=solution)
+        greedy_algo.run()
+
+        solution.run_checks()
+        solution.compute_service_time()
+
+    GLS = solver_objects.combiners.VNDGLS(random_seed=gls_seed, limit=1000, solution=solution,
+                                          checkpoint_path=checkpoint_path,
+                                          checkpoint_every=config.getint('OPTIONS', 'checkpoint_every'),
+                                          time_limit=config.getfloat('OPTIONS', 'time_limit') or None,
+                                          stagnation_limit=config.getint('OPTIONS', 'stagnation_limit') or None,
+                                          operators=solver_objects.combiners.operator_selection(
+                                              config.get('OPTIONS', 'operator_selection')))
+    profile_path = config.get('OPTIONS', 'profile') or None  # empty runs without counters
+    profiler = Profiler() if profile_path is not None else None
+    if profiler is not None:
+        GLS.enable_profiling(profiler)
+    for optimizer in build_optimizers(solution, pool):
+        GLS.add_pipeline(optimizer)
+    GLS.run(checkpoint)
+    if profiler is not None:
+        profiler.dump(profile_path)
 
     solution.compute_service_time()
     solution.run_checks()
+    return solution
 
-    printer.print_solution()
 
+def main(random_seed: int) -> None:
+    node_map = build_map(random_seed)
 
+    start_time = time.time()
+    workers = config.getint('OPTIONS', 'workers')  # 0 or 1 evaluates in this process
+    checkpoint_path = config.get('OPTIONS', 'checkpoint') or None  # empty runs without checkpoints
+    resume = checkpoint_path is not None and config.getboolean('OPTIONS', 'resume') and os.path.exists(checkpoint_path)
+    pool = EvaluationPool(node_map, workers) if workers > 1 else None
+    try:
+        solution = solve(node_map, gls_seed=1, pool=pool, checkpoint_path=checkpoint_path, resume=resume)
+    finally:  # a failed run must not leave the worker processes behind
+        if pool is not None:
+            pool.close()
+
+    printer = Printer(solution)
+    printer.print_solution()
 
     print(f"Solution time {solution.solution_time}")
     end_time = time.time()
@@ -1,8 +1,9 @@
-import itertools
 import math
-from copy import deepcopy
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
+import numpy as np
+
+from map_objects.matrices import TimeMatrixStore, CandidateLists, PenaltyOverlay
 from map_objects.node import Node, Vehicle
 
 
@@ -11,12 +12,19 @@ class MapManager:
         self.nodes = nodes
         self.vehicles = vehicles
         self.depot = vehicles[0].vehicle_route.node_sequence[0]  # save depot on mapManager
-        self.distance_matrix: Dict[Node, Dict[Node, float]] = {}
-        self.penalized_distance_matrix: Dict[Node, Dict[Node, float]] = {}
-        self.compute_distance_matrix()
+        self.check_node_ids()
+        self.demands = np.array([node.demand for node in self.nodes])
+        self.distance_matrix: np.ndarray = self.compute_distance_matrix()
+        self.penalties = PenaltyOverlay()
+        self.penalized_distance_matrix: np.ndarray = self.penalties.penalized_copy(self.distance_matrix)
+        # (vehicle index, node1 id, node2 id, factor) of every penalty, in order
+        self.penalty_log: List[Tuple[int, int, int, float]] = []
+        unloading_times = np.array([node.unloading_time for node in self.nodes], dtype=float)
+        self.time_matrices = TimeMatrixStore(distance_matrix=self.distance_matrix,
+                                             unloading_times=unloading_times)
         for vehicle in self.vehicles:
-            vehicle.compute_time_matrix(distance_matrix=self.distance_matrix)
-            vehicle.penalized_time_matrix = vehicle.time_matrix.copy()
+            self.time_matrices.assign(vehicle)
+        self.candidate_lists: Dict[int, CandidateLists] = {}
 
     @staticmethod
     def add_vehicle_route(vehicle: Vehicle, node: Node):
@@ -24,7 +32,7 @@ class MapManager:
 
     @staticmethod
     def insert_vehicle_route(vehicle: Vehicle, node: Node, idx: int):
-        vehicle.vehicle_route.node_sequence.insert(idx, node)
+        vehicle.vehicle_route.insert_node(idx, node)
 
     @staticmethod
     def update_vehicle_position(vehicle):
@@ -35,26 +43,55 @@ class MapManager:
         node.has_been_visited = True
 
     def update_cumul_costs(self):
-        """Update cached distance and time costs"""
+        """Update cached time costs, route demands are kept up to date by the routes themselves"""
         for vehicle in self.vehicles:
-            vehicle.vehicle_route.update_cumul_distance_cost()
             vehicle.update_cumul_time_cost()
 
-    @staticmethod
-    def compute_node_distance(node1: Node, node2: Node) -> float:
-        return math.sqrt((node1.x_cord - node2.x_cord) ** 2 + (node1.y_cord - node2.y_cord) ** 2)
+    def penalize_arc(self, node1: Node, node2: Node, factor: float, vehicle: Vehicle,
+                     index: Optional[int]) -> List[Vehicle]:
+        """
+        Set the penalized distance of arc node1 -> node2 to factor times its real distance,
+        and its penalized time on the given vehicle only, the other vehicles keep their times.
+        index is the position of node2 on the route of the vehicle, None when the arc is not on it,
+        callers that do not track the arcs look it up with Route.find_arc.
+        Returns the vehicles whose penalized route time changed.
+        """
+        self.penalties.penalize(node1.id, node2.id, factor)
+        vehicle.penalized_time_matrix.penalize(node1.id, node2.id, factor)
+        self.penalty_log.append((self.vehicles.index(vehicle), node1.id, node2.id, factor))
+        if index is None:
+            return []
+        vehicle.vehicle_route.mark_stale(index)  # the penalized times of the route change after the arc
+        vehicle.update_cumul_time_cost()
+        return [vehicle]
 
-    def compute_distance_matrix(self):
+    @property
+    def penalty_version(self) -> int:
+        """Number of penalties applied so far, lets optimizers and workers tell which penalties they have seen"""
+        return len(self.penalty_log)
 
-        for node1, node2 in itertools.product(self.nodes, repeat=2):
-            dist = self.compute_node_distance(node1, node2)
+    def check_node_ids(self):
+        """Matrices are indexed by node id, so ids must match the position of the node in self.nodes"""
+        for index, node in enumerate(self.nodes):
+            if node.id != index:
+                raise ValueError(f"Node {node} is at position {index}, node ids must be 0..{len(self.nodes) - 1}")
 
-            if not self.distance_matrix.get(node1):  # is None:
-                self.distance_matrix[node1] = {}
+    def get_candidate_lists(self, k: int) -> CandidateLists:
+        """k nearest neighbours of every customer, computed once per k"""
+        if k not in self.candidate_lists:
+            self.candidate_lists[k] = CandidateLists(self.distance_matrix, k, depot_id=self.depot.id)
+        return self.candidate_lists[k]
 
-            if not self.penalized_distance_matrix.get(node1):
-                self.penalized_distance_matrix[node1] = {}
+    def get_distance(self, node1: Node, node2: Node) -> float:
+        return self.distance_matrix[node1.id, node2.id]
+
+    @staticmethod
+    def compute_node_distance(node1: Node, node2: Node) -> float:
+        return math.sqrt((node1.x_cord - node2.x_cord) ** 2 + (node1.y_cord - node2.y_cord) ** 2)
 
-            self.distance_matrix.get(node1).update({node2: dist})
-            self.penalized_distance_matrix.get(node1).update({node2: dist})
+    def compute_distance_matrix(self) -> np.ndarray:
+        """Compute every pairwise euclidean distance in one pass, row/column i is node with id i"""
+        x_cords = np.array([node.x_cord for node in self.nodes], dtype=float)
+        y_cords = np.array([node.y_cord for node in self.nodes], dtype=float)
 
+        return np.sqrt((x_cords[:, None] - x_cords[None, :]) ** 2 + (y_cords[:, None] - y_cords[None, :]) ** 2)
@@ -0,0 +1,153 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from map_objects.node import Vehicle
+
+Profile = Tuple[int, int]  # (vehicle speed, unloading time)
+
+
+def compute_time_matrix(distance_matrix: np.ndarray, unloading_times: np.ndarray, vehicle_speed: int) -> np.ndarray:
+    """
+    Travel time in minutes between every pair of nodes, plus the unloading time of the destination node
+    :param distance_matrix: distances indexed by node id
+    :param unloading_times: unloading time of every node, indexed by node id
+    :param vehicle_speed: speed of the vehicle
+    """
+    time_matrix = (distance_matrix / vehicle_speed) * 60  # Convert to Minutes
+    time_matrix += unloading_times[None, :]
+    np.fill_diagonal(time_matrix, 0)
+    return time_matrix
+
+
+class PenaltyOverlay:
+    """
+    Arcs penalized by guided local search, kept sparse: how often every arc was penalized and its current factor.
+    Penalized distance matrices are made through the overlay and every penalty is written to all of them.
+    Time penalties are scoped to one vehicle and live in its PenalizedTimeMatrix instead.
+    """
+
+    def __init__(self):
+        self.counts: Dict[Tuple[int, int], int] = {}
+        self.factors: Dict[Tuple[int, int], float] = {}
+        self.matrices: List[Tuple[np.ndarray, np.ndarray]] = []  # (real, penalized) pairs kept in sync
+
+    def penalized_copy(self, matrix: np.ndarray) -> np.ndarray:
+        """Copy of matrix with the penalties so far, later penalties are applied to it as well"""
+        penalized_matrix = matrix.copy()
+        for (node1_id, node2_id), factor in self.factors.items():
+            penalized_matrix[node1_id, node2_id] = factor * matrix[node1_id, node2_id]
+        self.matrices.append((matrix, penalized_matrix))
+        return penalized_matrix
+
+    def penalize(self, node1_id: int, node2_id: int, factor: float):
+        """Set the penalized cost of arc node1 -> node2 to factor times its real cost in every matrix"""
+        arc = (node1_id, node2_id)
+        self.counts[arc] = self.counts.get(arc, 0) + 1
+        self.factors[arc] = factor
+        for matrix, penalized_matrix in self.matrices:
+            penalized_matrix[arc] = factor * matrix[arc]
+
+    def count(self, node1_id: int, node2_id: int) -> int:
+        """Times the arc was penalized, 0 for arcs that never were"""
+        return self.counts.get((node1_id, node2_id), 0)
+
+    def __len__(self):
+        return len(self.factors)
+
+
+class PenalizedTimeMatrix:
+    """
+    Penalized times of one vehicle: the shared time matrix of its profile with the factors of the arcs
+    penalized on this vehicle, so a penalty costs one entry instead of a copy of the matrix.
+    Indexed like the matrix itself, with two node ids or two arrays of them.
+    """
+
+    def __init__(self, time_matrix: np.ndarray):
+        self.time_matrix = time_matrix
+        self.factors: Dict[Tuple[int, int], float] = {}
+        self.keys: Optional[np.ndarray] = None  # sorted flat indices of the penalized arcs, built on demand
+        self.key_factors: Optional[np.ndarray] = None
+
+    def penalize(self, node1_id: int, node2_id: int, factor: float):
+        """Set the penalized time of arc node1 -> node2 to factor times its real time"""
+        self.factors[(node1_id, node2_id)] = factor
+        self.keys = None
+
+    def __getitem__(self, ids):
+        node1_ids, node2_ids = ids
+        time = self.time_matrix[node1_ids, node2_ids]
+        if not self.factors:
+            return time
+        if np.ndim(time) == 0:
+            factor = self.factors.get((node1_ids, node2_ids))
+            return time if factor is None else factor * time
+
+        if self.keys is None:
+            number_of_nodes = len(self.time_matrix)
+            keys = np.array([node1_id * number_of_nodes + node2_id for node1_id, node2_id in self.factors],
+                            dtype=np.intp)
+            order = np.argsort(keys)
+            self.keys = keys[order]
+            self.key_factors = np.fromiter(self.factors.values(), dtype=float, count=len(keys))[order]
+        flat = np.asarray(node1_ids) * len(self.time_matrix) + np.asarray(node2_ids)
+        positions = np.minimum(np.searchsorted(self.keys, flat), len(self.keys) - 1)
+        return np.where(self.keys[positions] == flat, self.key_factors[positions] * time, time)
+
+    def __len__(self):
+        return len(self.factors)
+
+
+class TimeMatrixStore:
+    """
+    Holds one time matrix per vehicle profile, vehicles with the same profile reference the same matrix.
+    Every vehicle gets its own PenalizedTimeMatrix on top of it, since time penalties are scoped per vehicle.
+    """
+
+    def __init__(self, distance_matrix: np.ndarray, unloading_times: np.ndarray):
+        self.distance_matrix = distance_matrix
+        self.unloading_times = unloading_times
+        self.time_matrices: Dict[Profile, np.ndarray] = {}
+
+    def assign(self, vehicle: Vehicle):
+        """Point the vehicle to the time matrix of its profile, computing it on first use"""
+        profile = vehicle.get_profile()
+        if profile not in self.time_matrices:
+            self.time_matrices[profile] = compute_time_matrix(self.distance_matrix, self.unloading_times,
+                                                              vehicle.vehicle_speed)
+
+        vehicle.time_matrix = self.time_matrices[profile]
+        vehicle.penalized_time_matrix = PenalizedTimeMatrix(vehicle.time_matrix)
+
+    def __len__(self):
+        return len(self.time_matrices)
+
+
+class CandidateLists:
+    """
+    The k nearest customers of every customer, used by the granular neighbourhoods.
+    The depot is left out of the lists since it sits at the start of every route.
+    """
+
+    def __init__(self, distance_matrix: np.ndarray, k: int, depot_id: int = 0, chunk_size: int = 1024):
+        number_of_nodes = len(distance_matrix)
+        self.k = min(k, number_of_nodes - 2)
+        self.neighbors = np.empty((number_of_nodes, self.k), dtype=np.intp)
+
+        for start in range(0, number_of_nodes, chunk_size):  # chunks keep the working copy small on large maps
+            rows = np.arange(start, min(start + chunk_size, number_of_nodes))
+            distances = distance_matrix[rows].copy()
+            distances[np.arange(len(rows)), rows] = np.inf
+            distances[:, depot_id] = np.inf
+
+            nearest = np.argpartition(distances, self.k - 1, axis=1)[:, :self.k]
+            order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1, kind='stable')
+            self.neighbors[rows] = np.take_along_axis(nearest, order, axis=1)
+
+        self.neighbors[depot_id] = -1
+        self.depot_id = depot_id
+
+    def pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Every (customer, neighbour) pair as two flat arrays"""
+        customers = np.delete(np.arange(len(self.neighbors)), self.depot_id)
+        return np.repeat(customers, self.k), self.neighbors[customers].ravel()
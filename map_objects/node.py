@@ -1,6 +1,8 @@
 import itertools
 import math
-from typing import List, Tuple, Dict
+from typing import List, Optional, Tuple
+
+import numpy as np
 
 
 class Node:
@@ -20,22 +22,87 @@ class Node:
 
 
 class Route:
+    """
+    Sequence of nodes served by a vehicle.
+    The load and cumul_demand are kept up to date by the methods that change node_sequence,
+    so the sequence should not be edited directly. Every change bumps version and lowers stale_from,
+    the first position whose cumulative times Vehicle.update_cumul_time_cost has to recompute.
+    """
     def __init__(self, depot: Node):
         self.node_sequence: List[Node] = [depot]
         self.total_time = 0.0
         self.total_distance = 0.0
-        self.cumul_demand = []
+        self.load = depot.demand
+        self.cumul_demand = [depot.demand]
+        self.version = 0
+        self.stale_from = 0
         self.cumul_time_cost = []
         self.penalized_cumul_time_cost = []
 
     def get_total_route_demand(self):
-        return sum((node.demand for node in self.node_sequence))
+        return self.load
 
     def update_cumul_distance_cost(self):
+        """Recompute load and cumul_demand from scratch"""
         self.cumul_demand = list(itertools.accumulate([node.demand for node in self.node_sequence]))
+        self.load = self.cumul_demand[-1]
+
+    def _refresh_cumul_demand(self, index: int):
+        """Recompute cumul_demand from position index onwards, positions before index are unchanged"""
+        del self.cumul_demand[index:]
+        demand = self.cumul_demand[-1] if index > 0 else 0
+        for node in self.node_sequence[index:]:
+            demand += node.demand
+            self.cumul_demand.append(demand)
+        self.load = self.cumul_demand[-1]
+        self.version += 1
+        self.mark_stale(index)
+
+    def mark_stale(self, index: int):
+        """Cumulative times from position index onwards are out of date"""
+        self.stale_from = min(self.stale_from, index)
 
     def update_route(self, node: Node):
         self.node_sequence.append(node)
+        self.load += node.demand
+        self.cumul_demand.append(self.load)
+        self.version += 1
+        self.mark_stale(len(self.node_sequence) - 1)
+
+    def insert_node(self, index: int, node: Node):
+        self.node_sequence.insert(index, node)
+        self._refresh_cumul_demand(index)
+
+    def remove_node(self, index: int) -> Node:
+        node = self.node_sequence.pop(index)
+        self._refresh_cumul_demand(index)
+        return node
+
+    def set_node(self, index: int, node: Node) -> Node:
+        """Replace the node at position index, returns the replaced node"""
+        replaced_node = self.node_sequence[index]
+        self.node_sequence[index] = node
+        self._refresh_cumul_demand(index)
+        return replaced_node
+
+    def reverse_segment(self, start: int, end: int):
+        """Reverse node_sequence[start:end], the load is unchanged"""
+        self.node_sequence[start:end] = self.node_sequence[start:end][::-1]
+        self._refresh_cumul_demand(start)
+
+    def replace_tail(self, index: int, nodes: List[Node]):
+        """Replace every node from position index onwards with nodes"""
+        self.node_sequence[index:] = nodes
+        self._refresh_cumul_demand(index)
+
+    def find_arc(self, node1: Node, node2: Node) -> Optional[int]:
+        """Position of node2 if it directly follows node1 on the route, None otherwise"""
+        if node1 not in self.node_sequence:
+            return None
+        index = self.node_sequence.index(node1) + 1
+        if index < len(self.node_sequence) and self.node_sequence[index] is node2:
+            return index
+        return None
 
     def get_last_node(self) -> Node:
         return self.node_sequence[-1]
@@ -90,32 +157,39 @@ class Vehicle:
         self.vehicle_route = Route(home_depot)
         self.vehicle_capacity = vehicle_capacity
         self.unloading_time = unloading_time
-        self.time_matrix: Dict[Node, Dict[Node, float]] = {}
-        self.penalized_time_matrix: Dict[Node, Dict[Node, float]] = {}
+        self.time_matrix: np.ndarray = np.empty((0, 0))
+        self.penalized_time_matrix = None  # PenalizedTimeMatrix of this vehicle, set by the MapManager
 
 
     def update_position(self):
         self.vehicle_position = self.vehicle_route.get_last_node()
 
     def update_cumul_time_cost(self):
-        self.vehicle_route.cumul_time_cost = []
-        self.vehicle_route.penalized_cumul_time_cost = []
-        time = 0
-        penalized_time = 0
-        self.vehicle_route.cumul_time_cost.append(time)
-        self.vehicle_route.penalized_cumul_time_cost.append(penalized_time)
-
-        for i in range(len(self.vehicle_route.node_sequence) - 1):
-            starting_node = self.vehicle_route.node_sequence[i]
-            destination_node = self.vehicle_route.node_sequence[i + 1]
-
-            time += self.time_matrix.get(starting_node).get(destination_node)
-            penalized_time += self.time_matrix.get(starting_node).get(destination_node)
-
-            self.vehicle_route.cumul_time_cost.append(time)
-            self.vehicle_route.penalized_cumul_time_cost.append(penalized_time)
-
-
+        """
+        Recompute the cumulative times from the first position changed since the last update, the prefix is kept.
+        The penalized times follow the penalized time matrix.
+        """
+        route = self.vehicle_route
+        start = min(route.stale_from, len(route.cumul_time_cost))
+        del route.cumul_time_cost[start:]
+        del route.penalized_cumul_time_cost[start:]
+        if start == 0:
+            route.cumul_time_cost.append(0)
+            route.penalized_cumul_time_cost.append(0)
+            start = 1
+
+        time = route.cumul_time_cost[-1]
+        penalized_time = route.penalized_cumul_time_cost[-1]
+        for i in range(start, len(route.node_sequence)):
+            starting_node = route.node_sequence[i - 1]
+            destination_node = route.node_sequence[i]
+
+            time += self.time_matrix[starting_node.id, destination_node.id]
+            penalized_time += self.penalized_time_matrix[starting_node.id, destination_node.id]
+
+            route.cumul_time_cost.append(time)
+            route.penalized_cumul_time_cost.append(penalized_time)
+        route.stale_from = len(route.node_sequence)
 
     def has_enough_capacity(self, node_demand: int) -> bool:
         """
@@ -124,26 +198,14 @@ class Vehicle:
         :param node_demand: demand to be added
         :return: bool
         """
-        return node_demand + self.vehicle_route.get_total_route_demand() <= self.vehicle_capacity
+        return node_demand + self.vehicle_route.load <= self.vehicle_capacity
 
     def __repr__(self):
         return f"ID {self.id}"
 
-    def compute_time_matrix(self, distance_matrix: Dict[Node, Dict[Node, float]]):
-        for starting_node in distance_matrix:
-            for destination_node in distance_matrix.get(starting_node):
-                dist = distance_matrix.get(starting_node).get(destination_node)
-
-                if starting_node == destination_node:
-                    time_to_travel = 0
-                else:
-                    time_to_travel = (dist / self.vehicle_speed) * 60  # Convert to Minutes
-                    time_to_travel += destination_node.unloading_time
-
-                if self.time_matrix.get(starting_node) is None:
-                    self.time_matrix[starting_node] = {}
-
-                self.time_matrix.get(starting_node).update({destination_node: time_to_travel})
+    def get_profile(self) -> Tuple[int, int]:
+        """Vehicles with the same speed and unloading time share their time matrices"""
+        return self.vehicle_speed, self.unloading_time
 
     def get_route_service_time(self):
         service_time = 0
@@ -151,7 +213,7 @@ class Vehicle:
             starting_node = self.vehicle_route.node_sequence[i]
             destination_node = self.vehicle_route.node_sequence[i + 1]
 
-            time = self.time_matrix.get(starting_node).get(destination_node)
+            time = self.time_matrix[starting_node.id, destination_node.id]
             service_time += time
 
         return service_time
@@ -0,0 +1,127 @@
+import copy
+import multiprocessing
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Iterable
+
+from main import config, build_map, solve
+from map_objects.mapmanager import MapManager
+from map_objects.printer import Printer
+from solver_objects.solution import Solution
+
+
+@dataclass
+class SeedResult:
+    seed: int
+    makespan: float
+    total_distance: float
+    wall_time: float
+    routes: List[List[int]]  # node ids of every route, in vehicle order
+
+
+@dataclass
+class MultiStartResult:
+    results: List[SeedResult]  # finished seeds, in seed order
+    cancelled: List[int]  # seeds still running or waiting when the time budget ran out
+    wall_time: float
+
+    @property
+    def best(self) -> Optional[SeedResult]:
+        return min(self.results, key=lambda result: (result.makespan, result.seed), default=None)
+
+
+def fresh_map(template: MapManager) -> MapManager:
+    """Copy of the template with its own nodes, routes and penalties, the real distance and time matrices are shared"""
+    shared = [template.distance_matrix, template.demands, *template.time_matrices.time_matrices.values()]
+    return copy.deepcopy(template, memo={id(array): array for array in shared})
+
+
+def build_solution(template: MapManager, routes: List[List[int]]) -> Solution:
+    """Solution on a fresh copy of the template with the given routes"""
+    node_map = fresh_map(template)
+    for vehicle, route in zip(node_map.vehicles, routes):
+        for node_id in route[1:]:  # every route already starts from the depot
+            node = node_map.nodes[node_id]
+            node_map.add_vehicle_route(vehicle, node)
+            node_map.update_node(node)
+        node_map.update_vehicle_position(vehicle)
+    node_map.update_cumul_costs()
+
+    solution = Solution(node_map)
+    solution.compute_service_time()
+    return solution
+
+
+_template: Optional[MapManager] = None  # instance of the worker process, set once by the pool initializer
+
+
+def _initialize_worker(template: MapManager, quiet: bool):
+    global _template
+    _template = template
+    if quiet:  # the solvers print every iteration
+        sys.stdout = open(os.devnull, 'w')
+
+
+def run_seed(seed: int) -> SeedResult:
+    start_time = time.time()
+    solution = solve(fresh_map(_template), gls_seed=seed)
+
+    return SeedResult(seed=seed,
+                      makespan=float(solution.solution_time),
+                      total_distance=float(solution.compute_total_distance()),
+                      wall_time=time.time() - start_time,
+                      routes=[[node.id for node in vehicle.vehicle_route.node_sequence]
+                              for vehicle in solution.map.vehicles])
+
+
+def run_multistart(template: MapManager,
+                   seeds: Iterable[int],
+                   processes: int,
+                   time_budget: Optional[float] = None,
+                   quiet: bool = True) -> MultiStartResult:
+    """
+    Run the construction and VNDGLS once per seed on the same instance, spread over a process pool.
+    Workers receive the template map once. When the time budget runs out the pool is terminated,
+    seeds that did not finish are reported as cancelled.
+    """
+    start_time = time.time()
+    deadline = start_time + time_budget if time_budget else None
+
+    pool = multiprocessing.Pool(processes=processes, initializer=_initialize_worker, initargs=(template, quiet))
+    try:
+        pending = {seed: pool.apply_async(run_seed, (seed,)) for seed in seeds}
+        for async_result in pending.values():
+            async_result.wait(None if deadline is None else max(deadline - time.time(), 0))
+            if deadline is not None and time.time() >= deadline:
+                break
+
+        results = [async_result.get() for async_result in pending.values() if async_result.ready()]
+        cancelled = [seed for seed, async_result in pending.items() if not async_result.ready()]
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return MultiStartResult(results=results, cancelled=cancelled, wall_time=time.time() - start_time)
+
+
+if __name__ == "__main__":
+    template = build_map(config.getint('OPTIONS', 'RANDOM_SEED'))
+    starts = config.getint('OPTIONS', 'starts')
+    processes = config.getint('OPTIONS', 'workers') or os.cpu_count()
+    time_budget = config.getfloat('OPTIONS', 'time_budget') or None  # 0 waits for every seed
+
+    multistart = run_multistart(template, seeds=range(1, starts + 1), processes=processes, time_budget=time_budget)
+
+    for result in multistart.results:
+        print(f"seed {result.seed}: makespan {result.makespan}, distance {result.total_distance}, "
+              f"{result.wall_time:.1f} seconds")
+    if multistart.cancelled:
+        print(f"cancelled seeds {multistart.cancelled}")
+
+    best = multistart.best
+    if best is not None:
+        Printer(build_solution(template, best.routes)).print_solution()
+        print(f"Best seed {best.seed}, solution time {best.makespan}")
+    print(f"Multistart took {multistart.wall_time} seconds to run")
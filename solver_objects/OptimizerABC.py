@@ -1,16 +1,183 @@
+import heapq
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from functools import partial
+from typing import List, Tuple, Dict, Optional, Iterable, Iterator, Callable
+
+import numpy as np
 
 from map_objects.node import Vehicle
-from solver_objects.move import OptimizerMove, DistanceType
-from solver_objects.solution import Solution
+from solver_objects.move import OptimizerMove, DistanceType, RouteArrays, CandidateBatch
+from solver_objects.parallel import EvaluationPool, PairJob
+from solver_objects.profiling import Profiler
+from solver_objects.solution import Solution, MakespanTracker
+
+
+class SelectionPolicy(ABC):
+    """Decides which of the moves offered during a scan are kept, without storing every improving move"""
+    done: bool  # True once the scan can stop early
+
+    @abstractmethod
+    def reset(self):
+        """Forget the moves of the previous scan"""
+        pass
+
+    @abstractmethod
+    def offer(self, move: OptimizerMove):
+        """Consider a move found by the scan"""
+        pass
+
+    @abstractmethod
+    def moves(self) -> List[OptimizerMove]:
+        """Kept moves, best first"""
+        pass
+
+    def offer_batch(self, move_costs: np.ndarray, materialize: Callable[[int], OptimizerMove]):
+        """
+        Consider moves stored as arrays, in scan order.
+        materialize builds the move of one row, policies only call it for the rows they keep.
+        """
+        for index in range(len(move_costs)):
+            self.offer(materialize(index))
+            if self.done:
+                return
+
+    def best(self) -> Optional[OptimizerMove]:
+        moves = self.moves()
+        return moves[0] if moves else None
+
+
+class BestImprovement(SelectionPolicy):
+    """Keep only the running best move, ties go to the move found first"""
+
+    def __init__(self):
+        self.best_move: Optional[OptimizerMove] = None
+        self.done = False
+
+    def reset(self):
+        self.best_move = None
+
+    def offer(self, move: OptimizerMove):
+        if self.best_move is None or move.move_cost < self.best_move.move_cost:
+            self.best_move = move
+
+    def offer_batch(self, move_costs: np.ndarray, materialize: Callable[[int], OptimizerMove]):
+        if not len(move_costs):
+            return
+        index = int(np.argmin(move_costs))  # first of the cheapest rows
+        if self.best_move is None or move_costs[index] < self.best_move.move_cost:
+            self.best_move = materialize(index)
+
+    def moves(self) -> List[OptimizerMove]:
+        return [self.best_move] if self.best_move is not None else []
+
+    def best(self) -> Optional[OptimizerMove]:
+        return self.best_move
+
+
+class TopK(SelectionPolicy):
+    """Keep the k best moves, e.g. to fall back on when the best ones are tabu"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.heap: List[Tuple[float, int, OptimizerMove]] = []  # max heap on (move_cost, arrival)
+        self.arrivals = 0
+        self.done = False
+
+    def reset(self):
+        self.heap = []
+        self.arrivals = 0
+
+    def offer(self, move: OptimizerMove):
+        self.arrivals += 1
+        entry = (-move.move_cost, -self.arrivals, move)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:  # better than the worst kept move
+            heapq.heapreplace(self.heap, entry)
+
+    def offer_batch(self, move_costs: np.ndarray, materialize: Callable[[int], OptimizerMove]):
+        # rows outside the k cheapest of the batch can not make it into the k best overall
+        for index in np.sort(np.argsort(move_costs, kind='stable')[:self.k]):
+            self.offer(materialize(int(index)))
+
+    def moves(self) -> List[OptimizerMove]:
+        return [entry[2] for entry in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
+
+
+class FirstImprovement(SelectionPolicy):
+    """Keep the first move offered and stop the scan there"""
+
+    def __init__(self):
+        self.first_move: Optional[OptimizerMove] = None
+        self.done = False
+
+    def reset(self):
+        self.first_move = None
+        self.done = False
+
+    def offer(self, move: OptimizerMove):
+        if self.first_move is None:
+            self.first_move = move
+            self.done = True
+
+    def offer_batch(self, move_costs: np.ndarray, materialize: Callable[[int], OptimizerMove]):
+        if len(move_costs):
+            self.offer(materialize(0))
+
+    def moves(self) -> List[OptimizerMove]:
+        return [self.first_move] if self.first_move is not None else []
+
+
+def selection_policy(name: str, k: int = 1) -> SelectionPolicy:
+    """Build a selection policy from its config name: best, first or top_k"""
+    if name == 'best':
+        return BestImprovement()
+    if name == 'first':
+        return FirstImprovement()
+    if name == 'top_k':
+        return TopK(k)
+    raise ValueError(f"Unknown selection policy {name}")
 
 
 class Optimizer(ABC):
-    beneficial_moves: List[OptimizerMove]
+    selection: SelectionPolicy
     solution: Solution
     run_again: bool
     distances: DistanceType
+    batched: bool
+    granular: Optional[int]  # number of nearest neighbours of the granular neighbourhood, None for the full one
+    cache_moves: bool
+    pair_cache: Dict[Tuple[Vehicle, Vehicle], Tuple[Tuple[int, int], CandidateBatch]]
+    pair_cache_key: Optional[Tuple[DistanceType, int]]
+    pool: Optional[EvaluationPool]  # evaluates the vehicle pairs in worker processes when set
+    pair_evaluator: Callable[..., CandidateBatch]  # static batched evaluator of one vehicle pair
+    scanned: int  # candidates covered by the last scan, cached vehicle pairs included
+
+    def __init__(self, solution: Solution, batched: bool = False, granular: Optional[int] = None,
+                 cache_moves: bool = False, selection: Optional[SelectionPolicy] = None,
+                 pool: Optional[EvaluationPool] = None):
+        self.solution = solution
+        self.run_again = True
+        self.selection = selection or BestImprovement()
+        self.distances = None
+        self.batched = batched
+        self.granular = granular
+        self.cache_moves = cache_moves
+        self.pair_cache = {}
+        self.pair_cache_key = None
+        self.pool = pool
+        self.check_pool()
+        self.scanned = 0
+
+    def start_scan(self, distances: DistanceType):
+        self.distances = distances  # Set Distances
+        self.selection.reset()
+        self.scanned = 0
+
+    @property
+    def batched_scan(self) -> bool:
+        """Granular neighbourhoods, the move cache and the pool all go through the batched evaluators"""
+        return self.batched or bool(self.granular) or self.cache_moves or self.pool is not None
 
     @abstractmethod
     def generate_solution_space(self, distance: DistanceType):
@@ -38,6 +205,24 @@ class Optimizer(ABC):
         """Apply Move"""
         pass
 
+    @abstractmethod
+    def route_pairs(self) -> Iterable[Tuple[Vehicle, Vehicle]]:
+        """Vehicle pairs the operator visits, in scan order"""
+        pass
+
+    @abstractmethod
+    def evaluate_route_pair(self, vehicle1: Vehicle, vehicle2: Vehicle, route_arrays: Dict[Vehicle, RouteArrays],
+                            first_pos: Optional[np.ndarray] = None,
+                            second_pos: Optional[np.ndarray] = None) -> CandidateBatch:
+        """Feasible moves of one vehicle pair, on every position or on the given candidate positions"""
+        pass
+
+    @abstractmethod
+    def generate_granular_positions(self, route_arrays: Dict[Vehicle, RouteArrays]) \
+            -> Dict[Tuple[Vehicle, Vehicle], Tuple[np.ndarray, np.ndarray]]:
+        """Positions of the moves that create at least one edge between nearest neighbours"""
+        pass
+
     @staticmethod
     def feasible_combination(first_pos: int, second_pos: int, vehicle1: Vehicle, vehicle2: Vehicle) -> bool:
         """Check if all indices are inside the bounds of the route list"""
@@ -47,17 +232,42 @@ class Optimizer(ABC):
             return False
         return True
 
+    @staticmethod
+    def allowed_move(first_pos: int, second_pos: int, vehicle1: Vehicle, vehicle2: Vehicle) -> bool:
+        """Rules of the move type on a position pair inside both routes, checked before capacity_check"""
+        return True
+
     def handle_move(self, move: OptimizerMove):
         if move.move_cost < 0:
             self.add_move(move)
             self.run_again = True
 
     def add_move(self, move: OptimizerMove):
-        self.beneficial_moves.append(move)
+        self.selection.offer(move)
+
+    def handle_moves(self, move_costs: np.ndarray, materialize: Callable[[int], OptimizerMove]):
+        """Counterpart of handle_move for improving moves stored as arrays, see SelectionPolicy.offer_batch"""
+        if len(move_costs):
+            self.selection.offer_batch(move_costs, materialize)
+            self.run_again = True
+
+    def enable_profiling(self, profiler: Profiler):
+        """Count scans, candidates and applied moves of this optimizer in the profiler"""
+        profiler.attach(self)
+
+    @property
+    def beneficial_moves(self) -> List[OptimizerMove]:
+        """Moves kept by the selection policy during the last scan, best first"""
+        return self.selection.moves()
+
+    @beneficial_moves.setter
+    def beneficial_moves(self, moves: List[OptimizerMove]):
+        self.selection.reset()
+        for move in moves:
+            self.selection.offer(move)
 
     def apply_best_move(self):
-        self.beneficial_moves.sort(key=lambda move: move.move_cost)
-        best_move = self.beneficial_moves[0]
+        best_move = self.selection.best()
         old_time = self.solution.solution_time
         est_time = self.solution.solution_time + best_move.time_cost
         self.apply_move(best_move.first_pos, best_move.second_pos, best_move.vehicle1, best_move.vehicle2)
@@ -72,32 +282,27 @@ class Optimizer(ABC):
         #     raise ValueError("Error On Cost Calculation")
         if old_time > new_time:
             print(F"OLD: {old_time}, NEW :{new_time}, {self.solution.compute_total_distance()}")
-        self.beneficial_moves = []
+        self.selection.reset()
 
     def update_cache(self, *args: Tuple[Vehicle, float]):
         for arg in args:
             arg[0].update_cumul_time_cost()
-            arg[0].vehicle_route.update_cumul_distance_cost()
-        # self.solution.update_service_time_from_cache(*args)
-        self.solution.compute_service_time()
+        self.solution.update_service_time_from_cache(*(vehicle for vehicle, _ in args))
 
     def iterator_controller(self):
         return self.run_again
 
     def determine_new_solution_time(self, *args: Tuple[Vehicle, float], distance: DistanceType) -> float:
         """
-        Compute on the fly new solution time by copying dictionaries of vehicle times
+        Compute on the fly new solution time from the makespan tracker of the solution
         Returns a float that represents new slowest route
         """
-        if distance == DistanceType.PENALIZED:
-            vehicle_times_copy = self.solution.penalized_vehicle_times.copy()
-        else:
-            vehicle_times_copy = self.solution.vehicle_times.copy()
+        return self.determine_makespan(distance).max_with(*args)
 
-        for vehicle, time in args:
-            vehicle_times_copy.update({vehicle: time})
-        slowest_vehicle = max(vehicle_times_copy, key=lambda x: vehicle_times_copy.get(x))
-        return vehicle_times_copy.get(slowest_vehicle)
+    def determine_makespan(self, distance: DistanceType) -> MakespanTracker:
+        if distance == DistanceType.PENALIZED:
+            return self.solution.penalized_makespan
+        return self.solution.makespan
 
     def determine_time_matrix(self, vehicle1: Vehicle, vehicle2: Vehicle):
         if self.distances == DistanceType.PENALIZED:
@@ -126,3 +331,147 @@ class Optimizer(ABC):
             cumul_time2 = vehicle2.vehicle_route.cumul_time_cost
 
         return cumul_time1, cumul_time2
+
+    def generate_batched_solution_space(self):
+        for vehicle1, vehicle2, batch in self.iterate_route_pairs():
+            self.handle_moves(batch.move_cost(), partial(batch.to_move, vehicle1=vehicle1, vehicle2=vehicle2))
+            if self.selection.done:
+                return
+
+    def evaluate_route_pairs(self) -> List[Tuple[Vehicle, Vehicle, CandidateBatch]]:
+        return list(self.iterate_route_pairs())
+
+    def iterate_route_pairs(self) -> Iterator[Tuple[Vehicle, Vehicle, CandidateBatch]]:
+        """
+        Batched evaluation of every vehicle pair, or only of the granular candidates when granular is set.
+        Pairs are evaluated lazily so a scan that stops early does not evaluate the remaining pairs.
+        """
+        route_arrays = {vehicle: self.build_route_arrays(vehicle) for vehicle in self.solution.map.vehicles}
+        candidate_positions = self.generate_granular_positions(route_arrays) if self.granular else None
+        if self.pool is not None:
+            yield from self.evaluate_in_pool(route_arrays, candidate_positions)
+            return
+        if self.cache_moves:
+            self.check_pair_cache()
+
+        for vehicle1, vehicle2, first_pos, second_pos in self.select_route_pairs(candidate_positions):
+            if self.cache_moves:
+                batch = self.evaluate_cached_route_pair(vehicle1, vehicle2, route_arrays, first_pos, second_pos)
+            else:
+                batch = self.evaluate_route_pair(vehicle1, vehicle2, route_arrays, first_pos, second_pos)
+            self.scanned += batch.examined
+            batch = batch.improving()
+            if len(batch):
+                yield vehicle1, vehicle2, batch
+
+    def select_route_pairs(self, candidate_positions: Optional[Dict[Tuple[Vehicle, Vehicle], Tuple[np.ndarray, np.ndarray]]]) \
+            -> Iterator[Tuple[Vehicle, Vehicle, Optional[np.ndarray], Optional[np.ndarray]]]:
+        """Vehicle pairs to evaluate in scan order, with their candidate positions or None for every position"""
+        for vehicle1, vehicle2 in self.route_pairs():
+            if candidate_positions is None:
+                yield vehicle1, vehicle2, None, None
+            elif (vehicle1, vehicle2) in candidate_positions:
+                yield (vehicle1, vehicle2) + candidate_positions[(vehicle1, vehicle2)]
+
+    def check_pool(self):
+        """Parallel evaluation only returns the cheapest moves, so a pool needs the BestImprovement policy"""
+        if self.pool is not None and not isinstance(self.selection, BestImprovement):
+            raise ValueError("Parallel evaluation only returns the cheapest moves, use the BestImprovement policy")
+
+    def evaluate_in_pool(self, route_arrays: Dict[Vehicle, RouteArrays],
+                         candidate_positions: Optional[Dict[Tuple[Vehicle, Vehicle], Tuple[np.ndarray, np.ndarray]]]) \
+            -> List[Tuple[Vehicle, Vehicle, CandidateBatch]]:
+        """
+        Evaluate the vehicle pairs in the worker processes of the pool.
+        Only the cheapest moves come back, which is all best improvement needs to pick the same move as the serial scan.
+        """
+        vehicles = self.solution.map.vehicles
+        index_of = {vehicle: index for index, vehicle in enumerate(vehicles)}
+        pairs = list(self.select_route_pairs(candidate_positions))
+        jobs = [PairJob(pair_index=pair_index,
+                        vehicle1=index_of[vehicle1],
+                        vehicle2=index_of[vehicle2],
+                        profile1=vehicle1.get_profile(),
+                        profile2=vehicle2.get_profile(),
+                        other_vehicles_time=self.determine_other_vehicles_time(vehicle1, vehicle2),
+                        first_pos=first_pos,
+                        second_pos=second_pos)
+                for pair_index, (vehicle1, vehicle2, first_pos, second_pos) in enumerate(pairs)]
+
+        results, examined = self.pool.evaluate(evaluator=self.pair_evaluator,
+                                               distances=self.distances,
+                                               solution_time=self.solution.solution_time,
+                                               route_arrays=[route_arrays[vehicle] for vehicle in vehicles],
+                                               jobs=jobs)
+        self.scanned += examined
+        return [(pairs[pair_index][0], pairs[pair_index][1], batch) for pair_index, batch in results]
+
+    def evaluate_cached_route_pair(self, vehicle1: Vehicle, vehicle2: Vehicle, route_arrays: Dict[Vehicle, RouteArrays],
+                                   first_pos: Optional[np.ndarray] = None,
+                                   second_pos: Optional[np.ndarray] = None) -> CandidateBatch:
+        """
+        Moves of a vehicle pair whose routes did not change since the last scan are taken from the cache.
+        Their new route times still hold, only the time cost is re-scored since the other routes may have changed.
+        """
+        versions = (vehicle1.vehicle_route.version, vehicle2.vehicle_route.version)
+        cached = self.pair_cache.get((vehicle1, vehicle2))
+        if cached is not None and cached[0] == versions:
+            return cached[1].rescore(other_vehicles_time=self.determine_other_vehicles_time(vehicle1, vehicle2),
+                                     solution_time=self.solution.solution_time)
+
+        batch = self.evaluate_route_pair(vehicle1, vehicle2, route_arrays, first_pos, second_pos)
+        self.pair_cache[(vehicle1, vehicle2)] = (versions, batch)
+        return batch
+
+    def check_pair_cache(self):
+        """Cached moves only hold for the distances and penalties they were evaluated with"""
+        cache_key = (self.distances, self.solution.map.penalty_version)
+        if cache_key != self.pair_cache_key:
+            self.pair_cache = {}
+            self.pair_cache_key = cache_key
+
+    def build_route_arrays(self, vehicle: Vehicle) -> RouteArrays:
+        route = vehicle.vehicle_route
+        ids = np.fromiter((node.id for node in route.node_sequence), dtype=np.intp, count=len(route.node_sequence))
+        cumul_time, _ = self.determine_cumuls_costs(vehicle, vehicle)
+
+        return RouteArrays(ids=ids,
+                           load=route.load,
+                           capacity=vehicle.vehicle_capacity,
+                           route_time=route.cumul_time_cost[-1],
+                           cumul_time=np.asarray(cumul_time),
+                           cumul_demand=np.asarray(route.cumul_demand))
+
+    def determine_other_vehicles_time(self, *vehicles: Vehicle) -> float:
+        """Slowest time among the vehicles that do not take part in the move"""
+        return self.determine_makespan(self.distances).max_excluding(*vehicles)
+
+    def locate_candidate_pairs(self, route_arrays: Dict[Vehicle, RouteArrays]) -> Tuple[np.ndarray, ...]:
+        """
+        Route index and position of both ends of every (customer, nearest neighbour) pair.
+        Route indexes follow self.solution.map.vehicles.
+        """
+        route_of = np.full(len(self.solution.map.nodes), -1)
+        position_of = np.full(len(self.solution.map.nodes), -1)
+        for index, vehicle in enumerate(self.solution.map.vehicles):
+            customers = route_arrays[vehicle].ids[1:]
+            route_of[customers] = index
+            position_of[customers] = np.arange(1, len(customers) + 1)
+
+        customer, neighbor = self.solution.map.get_candidate_lists(self.granular).pairs()
+        routed = (route_of[customer] >= 0) & (route_of[neighbor] >= 0)
+        customer, neighbor = customer[routed], neighbor[routed]
+        return route_of[customer], position_of[customer], route_of[neighbor], position_of[neighbor]
+
+    def group_by_route_pair(self,
+                            route1: np.ndarray,
+                            first_pos: np.ndarray,
+                            route2: np.ndarray,
+                            second_pos: np.ndarray) -> Dict[Tuple[Vehicle, Vehicle], Tuple[np.ndarray, np.ndarray]]:
+        """Drop duplicate candidates and split them per vehicle pair, positions come back in scan order"""
+        candidates = np.unique(np.stack((route1, route2, first_pos, second_pos), axis=1), axis=0)
+        pair_starts = np.flatnonzero(np.any(np.diff(candidates[:, :2], axis=0) != 0, axis=1)) + 1
+
+        vehicles = self.solution.map.vehicles
+        return {(vehicles[group[0, 0]], vehicles[group[0, 1]]): (group[:, 2], group[:, 3])
+                for group in np.split(candidates, pair_starts) if len(group)}
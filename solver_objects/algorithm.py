@@ -1,5 +1,8 @@
 import random
-from typing import Protocol, Tuple, List
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Protocol, Tuple, List, Dict, Optional
+
+import numpy as np
 
 from map_objects.mapmanager import MapManager
 from map_objects.node import Node, Vehicle
@@ -117,8 +120,8 @@ class BaseAlgo2:
 
         vehicle_pos = vehicle.vehicle_route.get_last_node()
 
-        distances = self.map.distance_matrix.get(vehicle_pos)
-        distances = {node: dist for node, dist in distances.items() if
+        distances = self.map.distance_matrix[vehicle_pos.id]
+        distances = {node: distances[node.id] for node in self.map.nodes if
                      not node.has_been_visited and vehicle.has_enough_capacity(node.demand)}
 
         if not distances:
@@ -140,14 +143,153 @@ class BaseAlgo2:
         return all(has_been_visited)  # if every node has been visited, return True
 
 
+class InsertionCostCache:
+    """
+    Insertion costs of every open node into every route, used by MinimumInsertions.
+    Only routes that changed since the last lookup are evaluated again. For every node and route it keeps
+    the positions that can still be the cheapest for some makespan: a position is dropped when an earlier one
+    is neither slower nor longer, since the earlier one would then win the scan.
+    """
+
+    def __init__(self, _map: MapManager, executor: Optional[Executor] = None):
+        self.map = _map
+        self.executor = executor
+        self.positions: Dict[Vehicle, np.ndarray] = {}  # kept insertion positions, one row per node
+        self.new_times: Dict[Vehicle, np.ndarray] = {}  # route time after each kept insertion, inf on padding
+        self.distance_costs: Dict[Vehicle, np.ndarray] = {}
+        self.slowest_new_times: Dict[Vehicle, np.ndarray] = {}  # slowest kept insertion of every node, -inf if none
+        self.dirty = set(_map.vehicles)
+        # cheapest kept position of every node and route, scored against the makespan stored in score_keys
+        self.best_costs = np.full((len(_map.nodes), len(_map.vehicles)), np.inf)
+        self.best_columns = np.zeros(self.best_costs.shape, dtype=np.intp)
+        self.score_keys: Dict[Vehicle, Tuple[float, float]] = {}
+
+    def mark_dirty(self, vehicle: Vehicle):
+        self.dirty.add(vehicle)
+
+    def open_nodes(self) -> np.ndarray:
+        return np.fromiter((not (node.do_not_consider or node.has_been_visited) for node in self.map.nodes),
+                           dtype=bool, count=len(self.map.nodes))
+
+    def find_best_move(self, solution: Solution) -> Optional[MinimumInsertionMove]:
+        """Cheapest insertion with the costs and the (node, vehicle, position) tie breaking of the full scan"""
+        best_costs = self.refresh(solution)
+        node_id, k = np.unravel_index(np.argmin(best_costs), best_costs.shape)
+        if not np.isfinite(best_costs[node_id, k]):
+            return None
+        return self.build_move(solution, node_id, k)
+
+    def refresh(self, solution: Solution) -> np.ndarray:
+        """
+        Cheapest insertion cost of every node into every route, inf for closed nodes and routes they do not fit.
+        Changed routes are evaluated independently of each other, on the executor when one is given.
+        """
+        open_nodes = self.open_nodes()
+        node_ids = np.flatnonzero(open_nodes)
+        if self.executor is not None and len(self.dirty) > 1:
+            list(self.executor.map(lambda vehicle: self.evaluate_route(vehicle, node_ids), self.dirty))
+        else:
+            for vehicle in self.dirty:
+                self.evaluate_route(vehicle, node_ids)
+        for vehicle in self.dirty:
+            self.score_keys.pop(vehicle, None)
+        self.dirty = set()
+
+        for k, vehicle in enumerate(self.map.vehicles):
+            score_key = (solution.makespan.max_excluding(vehicle), solution.solution_time)
+            if self.score_keys.get(vehicle) != score_key:
+                self.score_route(k, vehicle, *score_key, previous_key=self.score_keys.get(vehicle))
+                self.score_keys[vehicle] = score_key
+
+        return np.where(open_nodes[:, None], self.best_costs, np.inf)
+
+    def build_move(self, solution: Solution, node_id: int, k: int) -> MinimumInsertionMove:
+        """Cheapest insertion of the node into the k-th route, as scored by the last refresh"""
+        vehicle = self.map.vehicles[k]
+        column = self.best_columns[node_id, k]
+        other_vehicles_time, solution_time = self.score_keys[vehicle]
+        new_solution_time = max(self.new_times[vehicle][node_id, column], other_vehicles_time)
+        return MinimumInsertionMove(target_pos=int(self.positions[vehicle][node_id, column]),
+                                    node_to_add=self.map.nodes[node_id],
+                                    vehicle=vehicle,
+                                    distance_cost=float(self.distance_costs[vehicle][node_id, column]),
+                                    time_cost=float(new_solution_time - solution_time))
+
+    def score_route(self, k: int, vehicle: Vehicle, other_vehicles_time: float, solution_time: float,
+                    previous_key: Optional[Tuple[float, float]] = None):
+        """
+        Cheapest kept position of every node on the k-th route, inf when the node does not fit.
+        While the route is not the slowest, an insertion that keeps it below the makespan costs its distance only,
+        so after a makespan change only the nodes with a slower insertion have to be scored again.
+        """
+        rows = slice(None)
+        if previous_key is not None and other_vehicles_time == solution_time and previous_key[0] == previous_key[1]:
+            rows = np.flatnonzero(self.slowest_new_times[vehicle] > min(solution_time, previous_key[1]))
+
+        move_costs = 1000 * (np.maximum(self.new_times[vehicle][rows], other_vehicles_time) - solution_time)
+        move_costs += self.distance_costs[vehicle][rows]
+        columns = np.argmin(move_costs, axis=1)
+        self.best_columns[rows, k] = columns
+        self.best_costs[rows, k] = np.take_along_axis(move_costs, columns[:, None], axis=1)[:, 0]
+        self.best_costs[self.map.demands + vehicle.vehicle_route.load > vehicle.vehicle_capacity, k] = np.inf
+
+    def evaluate_route(self, vehicle: Vehicle, node_ids: np.ndarray):
+        """Same costs as determine_distance_costs and determine_time_cost, for every node and position at once"""
+        route = vehicle.vehicle_route
+        ids = np.fromiter((node.id for node in route.node_sequence), dtype=np.intp, count=len(route.node_sequence))
+        next_ids = np.concatenate((ids[1:], ids[-1:]))
+        last = np.arange(len(ids)) == len(ids) - 1
+        distances, time_matrix = self.map.distance_matrix, vehicle.time_matrix
+        n, t, c = node_ids[:, None], ids[None, :], next_ids[None, :]
+
+        distance_costs = np.where(last, distances[t, n], distances[t, n] + distances[n, c]) - distances[t, c]
+        time_added = np.where(last, time_matrix[t, n], time_matrix[t, n] + time_matrix[n, c])
+        new_times = route.cumul_time_cost[-1] + time_added - distances[t, c]
+
+        keep = self.undominated(new_times, distance_costs)
+        width = int(keep.sum(axis=1).max(initial=1))
+        order = np.argsort(~keep, axis=1, kind='stable')[:, :width]  # kept positions first, in position order
+        padding = ~np.take_along_axis(keep, order, axis=1)
+
+        shape = (len(self.map.nodes), order.shape[1])
+        self.positions[vehicle] = np.zeros(shape, dtype=np.intp)
+        self.new_times[vehicle] = np.full(shape, np.inf)
+        self.distance_costs[vehicle] = np.full(shape, np.inf)
+        self.positions[vehicle][node_ids] = order
+        self.new_times[vehicle][node_ids] = np.where(padding, np.inf, np.take_along_axis(new_times, order, axis=1))
+        self.distance_costs[vehicle][node_ids] = np.where(padding, np.inf,
+                                                          np.take_along_axis(distance_costs, order, axis=1))
+        self.slowest_new_times[vehicle] = np.full(len(self.map.nodes), -np.inf)
+        self.slowest_new_times[vehicle][node_ids] = np.where(padding, -np.inf, self.new_times[vehicle][node_ids]).max(axis=1)
+
+    @staticmethod
+    def undominated(new_times: np.ndarray, distance_costs: np.ndarray) -> np.ndarray:
+        """
+        Drop positions for which an earlier position is neither slower nor longer.
+        Only the earlier positions holding the running minimum of either cost are checked, so a few
+        dominated positions may be kept, which costs a little time but never changes the result.
+        """
+        keep = np.ones(new_times.shape, dtype=bool)
+        columns = np.arange(new_times.shape[1])
+        for key, other in ((distance_costs, new_times), (new_times, distance_costs)):
+            running_min = np.minimum.accumulate(key, axis=1)
+            holder = np.maximum.accumulate(np.where(key == running_min, columns, 0), axis=1)
+            earlier = holder[:, :-1]  # holder of the running minimum before each position
+            dominated = (np.take_along_axis(key, earlier, axis=1) <= key[:, 1:]) & \
+                        (np.take_along_axis(other, earlier, axis=1) <= other[:, 1:])
+            keep[:, 1:] &= ~dominated
+        return keep
+
+
 class MinimumInsertions:
 
-    def __init__(self, _map: MapManager, solution: Solution):
+    def __init__(self, _map: MapManager, solution: Solution, incremental: bool = True):
         self.map = _map
         self.solution = solution
         self.solution.compute_service_time()
         self.map.update_cumul_costs()
         self.insertions = 0
+        self.insertion_costs = InsertionCostCache(_map) if incremental else None
 
     def run(self):
 
@@ -163,6 +305,12 @@ class MinimumInsertions:
             self.insertions += 1
 
     def find_next_best_move(self) -> MinimumInsertionMove:
+        if self.insertion_costs is not None:
+            return self.insertion_costs.find_best_move(self.solution)
+        return self.scan_next_best_move()
+
+    def scan_next_best_move(self) -> MinimumInsertionMove:
+        """Evaluate every open node at every position of every route"""
         min_cost = 10 ** 9
         best_move = None
         for node in self.map.nodes:
@@ -196,23 +344,23 @@ class MinimumInsertions:
 
     def determine_distance_costs(self, target_node: Node, c: Node, node_to_add: Node, vehicle: Vehicle):
 
-        distance_removed = self.map.distance_matrix.get(target_node).get(c)
+        distance_removed = self.map.distance_matrix[target_node.id, c.id]
         if target_node == vehicle.vehicle_route.node_sequence[-1]:  # if last node in sequence
-            distance_added = self.map.distance_matrix.get(target_node).get(node_to_add)
+            distance_added = self.map.distance_matrix[target_node.id, node_to_add.id]
         else:
-            distance_added = self.map.distance_matrix.get(target_node).get(node_to_add)
-            distance_added += self.map.distance_matrix.get(node_to_add).get(c)
+            distance_added = self.map.distance_matrix[target_node.id, node_to_add.id]
+            distance_added += self.map.distance_matrix[node_to_add.id, c.id]
 
         return distance_added, distance_removed
 
     def determine_time_cost(self, target_node, c, node_to_add, vehicle):
-        time_removed = self.map.distance_matrix.get(target_node).get(c)
+        time_removed = self.map.distance_matrix[target_node.id, c.id]
 
         if target_node == vehicle.vehicle_route.node_sequence[-1]:  # if last node in sequence
-            time_added = vehicle.time_matrix.get(target_node).get(node_to_add)
+            time_added = vehicle.time_matrix[target_node.id, node_to_add.id]
         else:
-            time_added = vehicle.time_matrix.get(target_node).get(node_to_add)
-            time_added += vehicle.time_matrix.get(node_to_add).get(c)
+            time_added = vehicle.time_matrix[target_node.id, node_to_add.id]
+            time_added += vehicle.time_matrix[node_to_add.id, c.id]
 
         new_vehicle_time = vehicle.vehicle_route.cumul_time_cost[-1] + time_added - time_removed
 
@@ -223,26 +371,57 @@ class MinimumInsertions:
     def apply_move(self, best_move: MinimumInsertionMove):
         self.map.insert_vehicle_route(best_move.vehicle, best_move.node_to_add, best_move.target_pos + 1)
 
-        self.solution.compute_service_time()  # update slowest Vehicle
         best_move.vehicle.update_cumul_time_cost()  # update cumulative costs
+        self.solution.update_service_time_from_cache(best_move.vehicle)  # update slowest Vehicle
         best_move.node_to_add.has_been_visited = True
+        if self.insertion_costs is not None:
+            self.insertion_costs.mark_dirty(best_move.vehicle)
 
     def determine_new_solution_time(self, *args: Tuple[Vehicle, float]) -> float:
         """
-        Compute on the fly new solution time by copying dictionaries of vehicle times
+        Compute on the fly new solution time from the makespan tracker of the solution
         Returns a float that represents new slowest route
         """
-        vehicle_times_copy = self.solution.vehicle_times.copy()
+        return self.solution.makespan.max_with(*args)
+
+
+class RegretInsertions(MinimumInsertions):
+    """
+    Regret-k insertion: every iteration inserts the node that would lose the most by waiting,
+    measured as the gap between its cheapest route and its k-th cheapest route.
+    Nodes that fit in fewer than k routes have infinite regret, ties go to the cheaper insertion, then the lower node id.
+    Routes changed at the start are evaluated on a thread pool when workers > 1.
+    """
+
+    def __init__(self, _map: MapManager, solution: Solution, k: int = 2, workers: int = 0):
+        super().__init__(_map, solution)
+        self.k = min(k, len(_map.vehicles))
+        self.workers = workers
+
+    def run(self):
+        if self.workers <= 1:
+            return super().run()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.insertion_costs.executor = executor
+            super().run()
+        self.insertion_costs.executor = None
+
+    def find_next_best_move(self) -> Optional[MinimumInsertionMove]:
+        best_costs = self.insertion_costs.refresh(self.solution)
+        route_costs = np.sort(best_costs, axis=1)
+        insertable = np.isfinite(route_costs[:, 0])
+        if not insertable.any():
+            return None
 
-        for vehicle, time in args:
-            vehicle_times_copy.update({vehicle: time})
-        slowest_vehicle = max(vehicle_times_copy, key=lambda x: vehicle_times_copy.get(x))
-        return vehicle_times_copy.get(slowest_vehicle)
+        regrets = np.full(len(route_costs), -np.inf)
+        regrets[insertable] = route_costs[insertable, self.k - 1] - route_costs[insertable, 0]
+        node_id = np.lexsort((np.arange(len(route_costs)), route_costs[:, 0], -regrets))[0]
+        return self.insertion_costs.build_move(self.solution, node_id, int(np.argmin(best_costs[node_id])))
 
 
 class MinimumInsertionsRCL(MinimumInsertions):
     def __init__(self, _map: MapManager, solution: Solution, k=3):
-        super().__init__(_map, solution)
+        super().__init__(_map, solution, incremental=False)  # scans every insertion itself
         self.RCL = k
         random.seed(2)
 
@@ -278,7 +457,7 @@ class NearestNeighborRCL:
 
 class MinimumInsertionsTree(MinimumInsertions):
     def __init__(self, _map: MapManager, solution: Solution, tree_depth, candidate_moves: int):
-        super().__init__(_map, solution)
+        super().__init__(_map, solution, incremental=False)  # scans every insertion itself
         self.tree_depth = tree_depth
         self.candidate_moves = candidate_moves
         self.depth = -1
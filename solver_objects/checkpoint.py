@@ -0,0 +1,80 @@
+import os
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import numpy as np
+
+from solver_objects.solution import SolutionSnapshot
+
+
+@dataclass
+class Checkpoint:
+    """State a VNDGLS run needs to carry on exactly where it stopped"""
+    iteration: int
+    number_of_nodes: int
+    solution: SolutionSnapshot
+    best_solution: SolutionSnapshot
+    penalty_log: List[Tuple[int, int, int, float]]  # replaying it rebuilds the penalty counts and penalized matrices
+    random_state: tuple
+    stagnation: int = 0  # iterations without a new best, for the stagnation stop
+    operator_state: List[float] = field(default_factory=list)  # learned weights of the operator selection
+
+
+def _pack(snapshot: SolutionSnapshot, prefix: str) -> dict:
+    """Routes of a snapshot as one id array and the positions it splits at, with its times"""
+    return {f'{prefix}_ids': np.concatenate(snapshot.routes),
+            f'{prefix}_splits': np.cumsum([len(route) for route in snapshot.routes])[:-1],
+            f'{prefix}_vehicle_times': np.array(snapshot.vehicle_times, dtype=float),
+            f'{prefix}_solution_time': snapshot.solution_time}
+
+
+def _unpack(data, prefix: str) -> SolutionSnapshot:
+    return SolutionSnapshot.from_routes(routes=np.split(data[f'{prefix}_ids'], data[f'{prefix}_splits']),
+                                        vehicle_times=data[f'{prefix}_vehicle_times'].tolist(),
+                                        solution_time=float(data[f'{prefix}_solution_time']))
+
+
+def save_checkpoint(path: str, checkpoint: Checkpoint):
+    """
+    Write the checkpoint as a single uncompressed .npz file, a few arrays of node ids, vehicle indices and factors.
+    The file is written next to path and moved over it, so a crash never leaves a half written checkpoint.
+    """
+    penalty_arcs = np.array([(vehicle_index, node1_id, node2_id)
+                             for vehicle_index, node1_id, node2_id, _ in checkpoint.penalty_log],
+                            dtype=np.intp).reshape(-1, 3)
+    penalty_factors = np.array([factor for _, _, _, factor in checkpoint.penalty_log], dtype=float)
+    random_version, random_internal_state, random_gauss_next = checkpoint.random_state
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as file:
+        np.savez(file,
+                 iteration=checkpoint.iteration,
+                 stagnation=checkpoint.stagnation,
+                 number_of_nodes=checkpoint.number_of_nodes,
+                 penalty_arcs=penalty_arcs,
+                 penalty_factors=penalty_factors,
+                 random_version=random_version,
+                 random_internal_state=np.array(random_internal_state, dtype=np.int64),
+                 random_gauss_next=np.nan if random_gauss_next is None else random_gauss_next,
+                 operator_state=np.array(checkpoint.operator_state, dtype=float),
+                 **_pack(checkpoint.solution, 'solution'),
+                 **_pack(checkpoint.best_solution, 'best'))
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path: str) -> Checkpoint:
+    with np.load(path) as data:
+        random_gauss_next = float(data['random_gauss_next'])
+        return Checkpoint(
+            iteration=int(data['iteration']),
+            stagnation=int(data['stagnation']),
+            number_of_nodes=int(data['number_of_nodes']),
+            solution=_unpack(data, 'solution'),
+            best_solution=_unpack(data, 'best'),
+            penalty_log=[(int(vehicle_index), int(node1_id), int(node2_id), float(factor))
+                         for (vehicle_index, node1_id, node2_id), factor in zip(data['penalty_arcs'],
+                                                                                data['penalty_factors'])],
+            random_state=(int(data['random_version']),
+                          tuple(int(value) for value in data['random_internal_state']),
+                          None if np.isnan(random_gauss_next) else random_gauss_next),
+            operator_state=data['operator_state'].tolist())
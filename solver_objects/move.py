@@ -1,23 +1,28 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from enum import Enum, auto
 
+import numpy as np
+
 from map_objects.node import Vehicle, Node
 
 
 @dataclass
 class OptimizerMove:
+    # slots keep the many moves built during a scan small, move_cost is derived instead of stored
+    __slots__ = ('first_pos', 'second_pos', 'vehicle1', 'vehicle2', 'distance_cost', 'time_cost',
+                 'vehicle1_new_time', 'vehicle2_new_time')
     first_pos: int
     second_pos: int
     vehicle1: Vehicle
     vehicle2: Vehicle
     distance_cost: float
     time_cost: float
-    move_cost: float = field(init=False)
     vehicle1_new_time: float
     vehicle2_new_time: float
 
-    def __post_init__(self):
-        self.move_cost = 1000 * self.time_cost + self.distance_cost
+    @property
+    def move_cost(self) -> float:
+        return 1000 * self.time_cost + self.distance_cost
 
     def __eq__(self, other):
         return (self.first_pos, self.second_pos, self.vehicle1, self.vehicle2) == (
@@ -41,3 +46,73 @@ class DistanceType(Enum):
     NORMAL = auto()
     PENALIZED = auto()
 
+
+
+@dataclass
+class RouteArrays:
+    """Node ids and cached costs of a route, used by the batched evaluators"""
+    ids: np.ndarray
+    load: int
+    capacity: int
+    route_time: float
+    cumul_time: np.ndarray
+    cumul_demand: np.ndarray
+    previous_ids: np.ndarray = field(init=False)
+    next_ids: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        # same convention as Route.get_adjacent_nodes: first and last node are their own neighbours
+        self.previous_ids = np.concatenate((self.ids[:1], self.ids[:-1]))
+        self.next_ids = np.concatenate((self.ids[1:], self.ids[-1:]))
+
+
+@dataclass
+class CandidateBatch:
+    """Candidate moves of one route pair, stored as parallel arrays"""
+    first_pos: np.ndarray
+    second_pos: np.ndarray
+    distance_cost: np.ndarray
+    time_cost: np.ndarray
+    vehicle1_new_time: np.ndarray
+    vehicle2_new_time: np.ndarray
+    examined: int = 0  # position pairs inside both routes the evaluator looked at, kept by select
+
+    def __len__(self):
+        return len(self.first_pos)
+
+    @property
+    def rejected(self) -> int:
+        """Examined position pairs the evaluator filtered out, meaningful on the batch it returned"""
+        return self.examined - len(self)
+
+    def select(self, mask: np.ndarray) -> 'CandidateBatch':
+        return CandidateBatch(first_pos=self.first_pos[mask],
+                              second_pos=self.second_pos[mask],
+                              distance_cost=self.distance_cost[mask],
+                              time_cost=self.time_cost[mask],
+                              vehicle1_new_time=self.vehicle1_new_time[mask],
+                              vehicle2_new_time=self.vehicle2_new_time[mask],
+                              examined=self.examined)
+
+    def rescore(self, other_vehicles_time: float, solution_time: float) -> 'CandidateBatch':
+        """Same candidates with the time cost recomputed against the current makespan"""
+        new_solution_time = np.maximum(np.maximum(self.vehicle1_new_time, self.vehicle2_new_time), other_vehicles_time)
+        return replace(self, time_cost=new_solution_time - solution_time)
+
+    def move_cost(self) -> np.ndarray:
+        return 1000 * self.time_cost + self.distance_cost
+
+    def improving(self) -> 'CandidateBatch':
+        """Keep candidates that OptimizerMove would consider beneficial"""
+        return self.select(self.move_cost() < 0)
+
+    def to_move(self, index: int, vehicle1: Vehicle, vehicle2: Vehicle) -> OptimizerMove:
+        """Build the OptimizerMove of a single candidate"""
+        return OptimizerMove(first_pos=int(self.first_pos[index]),
+                             second_pos=int(self.second_pos[index]),
+                             vehicle1=vehicle1,
+                             vehicle2=vehicle2,
+                             distance_cost=float(self.distance_cost[index]),
+                             time_cost=float(self.time_cost[index]),
+                             vehicle1_new_time=float(self.vehicle1_new_time[index]),
+                             vehicle2_new_time=float(self.vehicle2_new_time[index]))
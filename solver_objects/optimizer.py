@@ -1,19 +1,18 @@
 import itertools
-from typing import Tuple, List
+from typing import Tuple, Dict, Optional
+
+import numpy as np
 
 from map_objects.node import Vehicle
 from solver_objects.OptimizerABC import Optimizer
-from solver_objects.move import OptimizerMove, DistanceType
+from solver_objects.move import OptimizerMove, DistanceType, RouteArrays, CandidateBatch
 from solver_objects.solution import Solution
 
 
 class SwapMoveOptimizer(Optimizer):
-    def __init__(self, solution: Solution):
-        self.solution = solution
-        self.run_again = True
-        self.beneficial_moves: List[OptimizerMove] = []
+    def __init__(self, solution: Solution, **options):
+        super().__init__(solution, **options)
         self.solution.map.update_cumul_costs()
-        self.distances = None
 
     def run(self):
         c = 0
@@ -31,21 +30,26 @@ class SwapMoveOptimizer(Optimizer):
         return c  # Used in VHS
 
     def generate_solution_space(self, distances: DistanceType = DistanceType.NORMAL):
-        self.distances = distances  # Set Distances
+        self.start_scan(distances)
+        if self.batched_scan:
+            self.generate_batched_solution_space()
+            return
+
         max_route_length = max(len(vehicle.vehicle_route.node_sequence) for vehicle in self.solution.map.vehicles)
 
         for first_pos, second_pos in itertools.combinations_with_replacement(range(1, max_route_length + 1), r=2):  # Every possible swap
             # For every possible 2 vehicles
             for vehicle1, vehicle2 in itertools.product(self.solution.map.vehicles, repeat=2):
-                if vehicle1 == vehicle2 and abs(first_pos - second_pos) <= 1:
-                    continue
-
                 # check if index position exits in said routes
                 if not self.feasible_combination(first_pos=first_pos,
                                                  second_pos=second_pos,
                                                  vehicle1=vehicle1,
                                                  vehicle2=vehicle2):
                     continue
+                self.scanned += 1
+
+                if not self.allowed_move(first_pos, second_pos, vehicle1, vehicle2):
+                    continue
 
                 # check if capacity can
                 if not self.capacity_check(first_pos=first_pos,
@@ -68,11 +72,164 @@ class SwapMoveOptimizer(Optimizer):
                                   time_cost=time_cost,
                                   vehicle1_new_time=v1_time,
                                   vehicle2_new_time=v2_time))
+                if self.selection.done:
+                    return
+
+    def generate_batched_solution_space(self):
+        """Evaluate the swaps of every vehicle pair at once, first improvement also scans every pair"""
+        batches = self.evaluate_route_pairs()
+        if not batches:
+            return
+
+        # the scalar scan loops over positions first and vehicle pairs second, keep that order for ties
+        pair_index = np.concatenate([np.full(len(batch), i) for i, (_, _, batch) in enumerate(batches)])
+        row_index = np.concatenate([np.arange(len(batch)) for _, _, batch in batches])
+        first_pos = np.concatenate([batch.first_pos for _, _, batch in batches])
+        second_pos = np.concatenate([batch.second_pos for _, _, batch in batches])
+        order = np.lexsort((pair_index, second_pos, first_pos))
+        move_costs = np.concatenate([batch.move_cost() for _, _, batch in batches])[order]
+
+        def materialize(index: int) -> OptimizerMove:
+            vehicle1, vehicle2, batch = batches[pair_index[order[index]]]
+            return batch.to_move(row_index[order[index]], vehicle1, vehicle2)
+
+        self.handle_moves(move_costs, materialize)
+
+    def route_pairs(self):
+        return itertools.product(self.solution.map.vehicles, repeat=2)
+
+    def generate_granular_positions(self, route_arrays: Dict[Vehicle, RouteArrays]):
+        """Swaps that put the neighbour right after or right before the customer"""
+        customer_route, customer_pos, neighbor_route, neighbor_pos = self.locate_candidate_pairs(route_arrays)
+
+        route_a = np.concatenate((customer_route, customer_route))
+        pos_a = np.concatenate((customer_pos + 1, customer_pos - 1))
+        route_b = np.concatenate((neighbor_route, neighbor_route))
+        pos_b = np.concatenate((neighbor_pos, neighbor_pos))
+
+        # the scan only visits first_pos <= second_pos, the same swap with the vehicles the other way round
+        a_first = pos_a <= pos_b
+        return self.group_by_route_pair(route1=np.where(a_first, route_a, route_b),
+                                        first_pos=np.where(a_first, pos_a, pos_b),
+                                        route2=np.where(a_first, route_b, route_a),
+                                        second_pos=np.where(a_first, pos_b, pos_a))
+
+    def evaluate_route_pair(self, vehicle1: Vehicle, vehicle2: Vehicle, route_arrays: Dict[Vehicle, RouteArrays],
+                            first_pos: Optional[np.ndarray] = None,
+                            second_pos: Optional[np.ndarray] = None) -> CandidateBatch:
+        time_distances_vehicle1, time_distances_vehicle2 = self.determine_time_matrix(vehicle1, vehicle2)
+
+        return self.evaluate_swaps(route1=route_arrays[vehicle1],
+                                   route2=route_arrays[vehicle2],
+                                   same_route=vehicle1 == vehicle2,
+                                   distances=self.determine_distance_matrix(),
+                                   time_distances_vehicle1=time_distances_vehicle1,
+                                   time_distances_vehicle2=time_distances_vehicle2,
+                                   demands=self.solution.map.demands,
+                                   other_vehicles_time=self.determine_other_vehicles_time(vehicle1, vehicle2),
+                                   solution_time=self.solution.solution_time,
+                                   first_pos=first_pos,
+                                   second_pos=second_pos)
+
+    @staticmethod
+    def evaluate_swaps(route1: RouteArrays,
+                       route2: RouteArrays,
+                       same_route: bool,
+                       distances: np.ndarray,
+                       time_distances_vehicle1: np.ndarray,
+                       time_distances_vehicle2: np.ndarray,
+                       demands: np.ndarray,
+                       other_vehicles_time: float,
+                       solution_time: float,
+                       first_pos: Optional[np.ndarray] = None,
+                       second_pos: Optional[np.ndarray] = None) -> CandidateBatch:
+        """
+        Array version of the scalar scan for one route pair, returns the feasible swaps.
+        Follows move_cost, capacity_check and determine_time_impact operation by operation,
+        so costs are identical to the scalar path.
+        Without candidate positions every position pair is evaluated.
+        """
+        smallest_route = min(len(route1.ids), len(route2.ids))
+        if first_pos is None:
+            positions = np.arange(1, smallest_route)
+            first_pos, second_pos = (grid.ravel() for grid in np.meshgrid(positions, positions, indexing='ij'))
+
+        # same bounds as feasible_combination and combinations_with_replacement
+        keep = (first_pos >= 1) & (first_pos <= second_pos) & (second_pos < smallest_route)
+        first_pos, second_pos = first_pos[keep], second_pos[keep]
+        examined = len(first_pos)
+
+        if same_route:  # same rule as allowed_move, intra-route swaps of neighbours are skipped
+            keep = second_pos - first_pos >= 2
+            first_pos, second_pos = first_pos[keep], second_pos[keep]
+
+        net_demand = demands[route2.ids[second_pos]] - demands[route1.ids[first_pos]]
+        keep = (route1.load + net_demand <= route1.capacity) & (route2.load - net_demand <= route2.capacity)
+        first_pos, second_pos = first_pos[keep], second_pos[keep]
+
+        a, swap_node1, c = route1.previous_ids[first_pos], route1.ids[first_pos], route1.next_ids[first_pos]
+        d, swap_node2, f = route2.previous_ids[second_pos], route2.ids[second_pos], route2.next_ids[second_pos]
+        swap_node2_last = swap_node2 == f
+        swap_node1_last = swap_node1 == c
+
+        # intra-route swaps of neighbours never get here, so there is no double counting to correct for
+        cost_removed = distances[a, swap_node1] + distances[swap_node1, c]
+        cost_removed += distances[d, swap_node2] + distances[swap_node2, f]
+        cost_added = distances[a, swap_node2] + distances[swap_node2, c]
+        cost_added += distances[d, swap_node1] + distances[swap_node1, f]
+        cost_added -= np.where(swap_node2_last, distances[swap_node1, f], 0)
+        cost_added -= np.where(swap_node1_last, distances[swap_node2, c], 0)
+        distance_cost = cost_added - cost_removed
+
+        if same_route:
+            vehicle1_net_effect = time_distances_vehicle1[a, swap_node2]
+            vehicle1_net_effect += time_distances_vehicle1[swap_node2, c]
+            vehicle1_net_effect -= time_distances_vehicle1[a, swap_node1]
+            vehicle1_net_effect -= time_distances_vehicle1[swap_node1, c]
+            vehicle1_net_effect += time_distances_vehicle1[d, swap_node1]
+            vehicle1_net_effect += time_distances_vehicle1[swap_node1, f]
+            vehicle1_net_effect -= time_distances_vehicle1[d, swap_node2]
+            vehicle1_net_effect -= time_distances_vehicle1[swap_node2, f]
+            vehicle1_net_effect -= np.where(swap_node2_last, time_distances_vehicle2[swap_node1, f], 0)
+            vehicle1_net_effect -= np.where(swap_node1_last, time_distances_vehicle1[swap_node2, c], 0)
+            vehicle2_net_effect = vehicle1_net_effect
+        else:
+            vehicle2_net_effect = time_distances_vehicle2[d, swap_node1]
+            vehicle2_net_effect += time_distances_vehicle2[swap_node1, f]
+            vehicle2_net_effect -= time_distances_vehicle2[d, swap_node2]
+            vehicle2_net_effect -= time_distances_vehicle2[swap_node2, f]
+            vehicle2_net_effect -= np.where(swap_node2_last, time_distances_vehicle2[swap_node1, f], 0)
+
+            vehicle1_net_effect = time_distances_vehicle1[a, swap_node2]
+            vehicle1_net_effect += time_distances_vehicle1[swap_node2, c]
+            vehicle1_net_effect -= time_distances_vehicle1[a, swap_node1]
+            vehicle1_net_effect -= time_distances_vehicle1[swap_node1, c]
+            vehicle1_net_effect -= np.where(swap_node1_last, time_distances_vehicle1[swap_node2, c], 0)
+
+        vehicle1_new_time = route1.route_time + vehicle1_net_effect
+        vehicle2_new_time = route2.route_time + vehicle2_net_effect
+        new_solution_time = np.maximum(np.maximum(vehicle1_new_time, vehicle2_new_time), other_vehicles_time)
+
+        return CandidateBatch(first_pos=first_pos,
+                              second_pos=second_pos,
+                              distance_cost=distance_cost,
+                              time_cost=new_solution_time - solution_time,
+                              vehicle1_new_time=vehicle1_new_time,
+                              vehicle2_new_time=vehicle2_new_time,
+                              examined=examined)
+
+    pair_evaluator = evaluate_swaps  # run by the worker processes of a pool
+
+    @staticmethod
+    def allowed_move(first_pos: int, second_pos: int, vehicle1: Vehicle, vehicle2: Vehicle) -> bool:
+        """Swapping neighbours of the same route is not a swap"""
+        return vehicle1 != vehicle2 or abs(first_pos - second_pos) > 1
 
     def apply_move(self, first_pos: int, second_pos: int, vehicle1: Vehicle, vehicle2: Vehicle):
         """Apply Swap Move"""
-        vehicle1.vehicle_route.node_sequence[first_pos], vehicle2.vehicle_route.node_sequence[second_pos] = \
-            vehicle2.vehicle_route.node_sequence[second_pos], vehicle1.vehicle_route.node_sequence[first_pos]
+        swap_node1 = vehicle1.vehicle_route.get_node_from_position(first_pos)
+        swap_node2 = vehicle2.vehicle_route.set_node(second_pos, swap_node1)
+        vehicle1.vehicle_route.set_node(first_pos, swap_node2)
 
     def move_cost(self,
                   first_pos: int,
@@ -90,28 +247,28 @@ class SwapMoveOptimizer(Optimizer):
     def determine_distance_costs(self, a, swap_node1, c, d, swap_node2, f, vehicle1, vehicle2) -> Tuple[float, float]:
         distances = self.determine_distance_matrix()
 
-        cost_removed = distances.get(a).get(swap_node1) + \
-                       distances.get(swap_node1).get(c)
+        cost_removed = distances[a.id, swap_node1.id] + \
+                       distances[swap_node1.id, c.id]
 
-        cost_removed += distances.get(d).get(swap_node2) + \
-                        distances.get(swap_node2).get(f)
+        cost_removed += distances[d.id, swap_node2.id] + \
+                        distances[swap_node2.id, f.id]
 
-        cost_added = distances.get(a).get(swap_node2) + \
-                     distances.get(swap_node2).get(c)
+        cost_added = distances[a.id, swap_node2.id] + \
+                     distances[swap_node2.id, c.id]
 
-        cost_added += distances.get(d).get(swap_node1) + \
-                      distances.get(swap_node1).get(f)
+        cost_added += distances[d.id, swap_node1.id] + \
+                      distances[swap_node1.id, f.id]
 
         if swap_node2 == f:  # if swap_node2 is last node on route:
-            cost_added -= distances.get(swap_node1).get(f)  # Cancel this
+            cost_added -= distances[swap_node1.id, f.id]  # Cancel this
 
         if swap_node1 == c:  # if swap_node1 is last node on route:
-            cost_added -= distances.get(swap_node2).get(c)
+            cost_added -= distances[swap_node2.id, c.id]
 
         if vehicle1 == vehicle2 and d == swap_node1 and c == swap_node2:  # in case of intra-route and swap nodes are next to each other
             # correct for double counting of arcs
-            cost_removed -= distances.get(swap_node1).get(c)
-            cost_removed -= distances.get(swap_node2).get(f)
+            cost_removed -= distances[swap_node1.id, c.id]
+            cost_removed -= distances[swap_node2.id, f.id]
 
         return cost_removed, cost_added
 
@@ -143,45 +300,45 @@ class SwapMoveOptimizer(Optimizer):
         time_distances_vehicle1, time_distances_vehicle2 = self.determine_time_matrix(vehicle1, vehicle2)
 
         if vehicle1 == vehicle2:
-            vehicle1_net_effect = time_distances_vehicle1.get(a).get(swap_node2)
-            vehicle1_net_effect += time_distances_vehicle1.get(swap_node2).get(c)
-            vehicle1_net_effect -= time_distances_vehicle1.get(a).get(swap_node1)
-            vehicle1_net_effect -= time_distances_vehicle1.get(swap_node1).get(c)
+            vehicle1_net_effect = time_distances_vehicle1[a.id, swap_node2.id]
+            vehicle1_net_effect += time_distances_vehicle1[swap_node2.id, c.id]
+            vehicle1_net_effect -= time_distances_vehicle1[a.id, swap_node1.id]
+            vehicle1_net_effect -= time_distances_vehicle1[swap_node1.id, c.id]
 
-            vehicle1_net_effect += time_distances_vehicle1.get(d).get(swap_node1)
-            vehicle1_net_effect += time_distances_vehicle1.get(swap_node1).get(f)
-            vehicle1_net_effect -= time_distances_vehicle1.get(d).get(swap_node2)
-            vehicle1_net_effect -= time_distances_vehicle1.get(swap_node2).get(f)
+            vehicle1_net_effect += time_distances_vehicle1[d.id, swap_node1.id]
+            vehicle1_net_effect += time_distances_vehicle1[swap_node1.id, f.id]
+            vehicle1_net_effect -= time_distances_vehicle1[d.id, swap_node2.id]
+            vehicle1_net_effect -= time_distances_vehicle1[swap_node2.id, f.id]
 
             if swap_node2 == f:  # if swap_node2 is last node on route:
-                vehicle1_net_effect -= time_distances_vehicle2.get(swap_node1).get(f)  # Cancel this
+                vehicle1_net_effect -= time_distances_vehicle2[swap_node1.id, f.id]  # Cancel this
 
             if swap_node1 == c:  # if swap_node1 is last node on route:
-                vehicle1_net_effect -= time_distances_vehicle1.get(swap_node2).get(c)
+                vehicle1_net_effect -= time_distances_vehicle1[swap_node2.id, c.id]
 
             if vehicle1 == vehicle2 and d == swap_node1 and c == swap_node2:  # in case of intra-route and swap nodes are next to each other
                 # correct for double counting of arcs
-                vehicle1_net_effect -= time_distances_vehicle1.get(swap_node1).get(c)
-                vehicle1_net_effect -= time_distances_vehicle1.get(swap_node2).get(f)
+                vehicle1_net_effect -= time_distances_vehicle1[swap_node1.id, c.id]
+                vehicle1_net_effect -= time_distances_vehicle1[swap_node2.id, f.id]
 
             vehicle2_net_effect = vehicle1_net_effect
 
         else:
-            vehicle2_net_effect = time_distances_vehicle2.get(d).get(swap_node1)
-            vehicle2_net_effect += time_distances_vehicle2.get(swap_node1).get(f)
-            vehicle2_net_effect -= time_distances_vehicle2.get(d).get(swap_node2)
-            vehicle2_net_effect -= time_distances_vehicle2.get(swap_node2).get(f)
+            vehicle2_net_effect = time_distances_vehicle2[d.id, swap_node1.id]
+            vehicle2_net_effect += time_distances_vehicle2[swap_node1.id, f.id]
+            vehicle2_net_effect -= time_distances_vehicle2[d.id, swap_node2.id]
+            vehicle2_net_effect -= time_distances_vehicle2[swap_node2.id, f.id]
 
-            vehicle1_net_effect = time_distances_vehicle1.get(a).get(swap_node2)
-            vehicle1_net_effect += time_distances_vehicle1.get(swap_node2).get(c)
-            vehicle1_net_effect -= time_distances_vehicle1.get(a).get(swap_node1)
-            vehicle1_net_effect -= time_distances_vehicle1.get(swap_node1).get(c)
+            vehicle1_net_effect = time_distances_vehicle1[a.id, swap_node2.id]
+            vehicle1_net_effect += time_distances_vehicle1[swap_node2.id, c.id]
+            vehicle1_net_effect -= time_distances_vehicle1[a.id, swap_node1.id]
+            vehicle1_net_effect -= time_distances_vehicle1[swap_node1.id, c.id]
 
             if swap_node2 == f:  # if swap_node2 is last node on route:
-                vehicle2_net_effect -= time_distances_vehicle2.get(swap_node1).get(f)  # Cancel this
+                vehicle2_net_effect -= time_distances_vehicle2[swap_node1.id, f.id]  # Cancel this
 
             if swap_node1 == c:  # if swap_node1 is last node on route:
-                vehicle1_net_effect -= time_distances_vehicle1.get(swap_node2).get(c)
+                vehicle1_net_effect -= time_distances_vehicle1[swap_node2.id, c.id]
 
         return vehicle1_net_effect, vehicle2_net_effect
 
@@ -191,12 +348,6 @@ class SwapMoveOptimizer(Optimizer):
 
 
 class ReLocatorOptimizer(Optimizer):
-    def __init__(self, solution: Solution):
-        self.solution = solution
-        self.run_again = True
-        self.beneficial_moves: List[OptimizerMove] = []
-        self.distances = None
-
     def run(self):
         self.c = 0
         self.run_again = True
@@ -210,7 +361,11 @@ class ReLocatorOptimizer(Optimizer):
         return self.c
 
     def generate_solution_space(self, distances: DistanceType = DistanceType.NORMAL):
-        self.distances = distances  # Set Distances
+        self.start_scan(distances)
+        if self.batched_scan:
+            self.generate_batched_solution_space()
+            return
+
         max_route_length = max(len(vehicle.vehicle_route.node_sequence) for vehicle in self.solution.map.vehicles)
 
         # for every single intra-route and inter-route combination
@@ -222,6 +377,7 @@ class ReLocatorOptimizer(Optimizer):
                                                  vehicle1=vehicle1,
                                                  vehicle2=vehicle2):
                     continue
+                self.scanned += 1
 
                 if not self.capacity_check(first_pos=first_pos,
                                            second_pos=second_pos,
@@ -249,6 +405,120 @@ class ReLocatorOptimizer(Optimizer):
                                   vehicle1_new_time=v1_time,
                                   vehicle2_new_time=v2_time)
                 )
+                if self.selection.done:
+                    return
+
+    def route_pairs(self):
+        return itertools.product(self.solution.map.vehicles, repeat=2)
+
+    def generate_granular_positions(self, route_arrays: Dict[Vehicle, RouteArrays]):
+        """Relocations of the customer right after or right before its neighbour"""
+        customer_route, customer_pos, neighbor_route, neighbor_pos = self.locate_candidate_pairs(route_arrays)
+
+        return self.group_by_route_pair(route1=np.concatenate((customer_route, customer_route)),
+                                        first_pos=np.concatenate((customer_pos, customer_pos)),
+                                        route2=np.concatenate((neighbor_route, neighbor_route)),
+                                        second_pos=np.concatenate((neighbor_pos, neighbor_pos - 1)))
+
+    def evaluate_route_pair(self, vehicle1: Vehicle, vehicle2: Vehicle, route_arrays: Dict[Vehicle, RouteArrays],
+                            first_pos: Optional[np.ndarray] = None,
+                            second_pos: Optional[np.ndarray] = None) -> CandidateBatch:
+        time_distances_vehicle1, time_distances_vehicle2 = self.determine_time_matrix(vehicle1, vehicle2)
+
+        return self.evaluate_relocations(route1=route_arrays[vehicle1],
+                                         route2=route_arrays[vehicle2],
+                                         same_route=vehicle1 == vehicle2,
+                                         distances=self.determine_distance_matrix(),
+                                         time_distances_vehicle1=time_distances_vehicle1,
+                                         time_distances_vehicle2=time_distances_vehicle2,
+                                         demands=self.solution.map.demands,
+                                         other_vehicles_time=self.determine_other_vehicles_time(vehicle1, vehicle2),
+                                         solution_time=self.solution.solution_time,
+                                         first_pos=first_pos,
+                                         second_pos=second_pos)
+
+    @staticmethod
+    def evaluate_relocations(route1: RouteArrays,
+                             route2: RouteArrays,
+                             same_route: bool,
+                             distances: np.ndarray,
+                             time_distances_vehicle1: np.ndarray,
+                             time_distances_vehicle2: np.ndarray,
+                             demands: np.ndarray,
+                             other_vehicles_time: float,
+                             solution_time: float,
+                             first_pos: Optional[np.ndarray] = None,
+                             second_pos: Optional[np.ndarray] = None) -> CandidateBatch:
+        """
+        Array version of the scalar scan for one route pair, returns the feasible relocations of the node
+        at first_pos of route1 behind the node at second_pos of route2.
+        Removal gains are computed once per source position and edge costs once per target position,
+        only the terms that depend on both nodes are gathered over the candidate position pairs.
+        Without candidate positions every position pair is evaluated.
+        """
+        smallest_route = min(len(route1.ids), len(route2.ids))
+        if first_pos is None:
+            source_positions = target_positions = np.arange(1, smallest_route)  # same bounds as feasible_combination
+            first_idx, second_idx = np.nonzero(np.triu(np.ones((len(source_positions),) * 2, dtype=bool), k=1))
+        else:
+            keep = (first_pos >= 1) & (second_pos < smallest_route) & (first_pos < second_pos)
+            source_positions, first_idx = np.unique(first_pos[keep], return_inverse=True)
+            target_positions, second_idx = np.unique(second_pos[keep], return_inverse=True)
+
+        examined = len(first_idx)
+
+        a = route1.previous_ids[source_positions]
+        swap_node1, c = route1.ids[source_positions], route1.next_ids[source_positions]
+        swap_node2, f = route2.ids[target_positions], route2.next_ids[target_positions]
+        swap_node1_last = swap_node1 == c
+        swap_node2_last = swap_node2 == f
+
+        # removing swap_node1 from its route, per source position
+        removal_cost = distances[a, swap_node1] + distances[swap_node1, c]
+        bypass_cost = distances[a, c]
+        time_added_vehicle1 = time_distances_vehicle1[a, c]
+        time_added_vehicle1 -= time_distances_vehicle1[a, swap_node1]
+        time_added_vehicle1 -= time_distances_vehicle1[swap_node1, c]
+        time_added_vehicle1 -= np.where(swap_node1_last, time_distances_vehicle1[a, c], 0)
+
+        # breaking the edge swap_node2 -> f, per target position
+        edge_cost = distances[swap_node2, f]
+        edge_time = time_distances_vehicle2[swap_node2, f]
+
+        # only keep the position pairs with enough capacity left on route2
+        keep = (route2.load + demands[swap_node1] <= route2.capacity)[first_idx]
+        first_idx, second_idx = first_idx[keep], second_idx[keep]
+
+        swap_node1, swap_node2, f = swap_node1[first_idx], swap_node2[second_idx], f[second_idx]
+        cost_removed = removal_cost[first_idx] + edge_cost[second_idx]
+        cost_added = bypass_cost[first_idx] + distances[swap_node1, swap_node2]
+        cost_added += distances[swap_node1, f]
+        cost_added -= np.where(swap_node2_last[second_idx], distances[swap_node2, swap_node1], 0)
+        cost_added -= np.where(swap_node1_last[first_idx], bypass_cost[first_idx], 0)
+
+        time_added_vehicle2 = time_distances_vehicle2[swap_node2, swap_node1]
+        time_added_vehicle2 += time_distances_vehicle2[swap_node1, f]
+        time_added_vehicle2 -= edge_time[second_idx]
+        time_added_vehicle2 -= np.where(swap_node2_last[second_idx], time_distances_vehicle2[swap_node2, swap_node1], 0)
+
+        if same_route:
+            vehicle1_new_time = route1.route_time + time_added_vehicle1[first_idx] + time_added_vehicle2
+            vehicle2_new_time = vehicle1_new_time
+        else:
+            vehicle1_new_time = route1.route_time + time_added_vehicle1[first_idx]
+            vehicle2_new_time = route2.route_time + time_added_vehicle2
+
+        new_solution_time = np.maximum(np.maximum(vehicle1_new_time, vehicle2_new_time), other_vehicles_time)
+
+        return CandidateBatch(first_pos=source_positions[first_idx],
+                              second_pos=target_positions[second_idx],
+                              distance_cost=cost_added - cost_removed,
+                              time_cost=new_solution_time - solution_time,
+                              vehicle1_new_time=vehicle1_new_time,
+                              vehicle2_new_time=vehicle2_new_time,
+                              examined=examined)
+
+    pair_evaluator = evaluate_relocations  # run by the worker processes of a pool
 
     def move_cost(self, first_pos: int, second_pos: int, vehicle1: Vehicle, vehicle2: Vehicle) -> float:
         a, swap_node1, c = vehicle1.vehicle_route.get_adjacent_nodes(first_pos)
@@ -269,18 +539,18 @@ class ReLocatorOptimizer(Optimizer):
         # we lose a-swap_node1, swap_node1-c, swap_node2-f
         # we gain a-c, swap_node1-swap_node2, swap_node1-f
 
-        cost_removed = distances.get(a).get(swap_node1)
-        cost_removed += distances.get(swap_node1).get(c)
-        cost_removed += distances.get(swap_node2).get(f)
+        cost_removed = distances[a.id, swap_node1.id]
+        cost_removed += distances[swap_node1.id, c.id]
+        cost_removed += distances[swap_node2.id, f.id]
 
-        cost_added = distances.get(a).get(c)
-        cost_added += distances.get(swap_node1).get(swap_node2)
-        cost_added += distances.get(swap_node1).get(f)
+        cost_added = distances[a.id, c.id]
+        cost_added += distances[swap_node1.id, swap_node2.id]
+        cost_added += distances[swap_node1.id, f.id]
 
         if swap_node2 == f:  # if swap_node2 is at end of route:
-            cost_added -= distances.get(swap_node2).get(swap_node1)
+            cost_added -= distances[swap_node2.id, swap_node1.id]
         if swap_node1 == c:  # if swap_node1 is at end of route:
-            cost_added -= distances.get(a).get(c)
+            cost_added -= distances[a.id, c.id]
 
         return cost_removed, cost_added
 
@@ -312,41 +582,36 @@ class ReLocatorOptimizer(Optimizer):
         """relocate swap node1 in front of swap node 2"""
         time_distances_vehicle1, time_distances_vehicle2 = self.determine_time_matrix(vehicle1, vehicle2)
 
-        time_added_vehicle2 = time_distances_vehicle2.get(swap_node2).get(swap_node1)
-        time_added_vehicle2 += time_distances_vehicle2.get(swap_node1).get(f)
-        time_added_vehicle2 -= time_distances_vehicle2.get(swap_node2).get(f)
+        time_added_vehicle2 = time_distances_vehicle2[swap_node2.id, swap_node1.id]
+        time_added_vehicle2 += time_distances_vehicle2[swap_node1.id, f.id]
+        time_added_vehicle2 -= time_distances_vehicle2[swap_node2.id, f.id]
 
-        time_added_vehicle1 = time_distances_vehicle1.get(a).get(c)
-        time_added_vehicle1 -= time_distances_vehicle1.get(a).get(swap_node1)
-        time_added_vehicle1 -= time_distances_vehicle1.get(swap_node1).get(c)
+        time_added_vehicle1 = time_distances_vehicle1[a.id, c.id]
+        time_added_vehicle1 -= time_distances_vehicle1[a.id, swap_node1.id]
+        time_added_vehicle1 -= time_distances_vehicle1[swap_node1.id, c.id]
 
         if swap_node2 == f:  # if swap_node2 is at end of route:
-            time_added_vehicle2 -= time_distances_vehicle2.get(swap_node2).get(swap_node1)
+            time_added_vehicle2 -= time_distances_vehicle2[swap_node2.id, swap_node1.id]
 
         if swap_node1 == c:  # if swap_node1 is at end of route:
-            time_added_vehicle1 -= time_distances_vehicle1.get(a).get(c)
+            time_added_vehicle1 -= time_distances_vehicle1[a.id, c.id]
 
         return time_added_vehicle2, time_added_vehicle1
 
     def apply_move(self, first_pos, second_pos, vehicle1, vehicle2):
         """Apply Relocation Move"""
-        vehicle2.vehicle_route.node_sequence.insert(second_pos + 1, vehicle1.vehicle_route.node_sequence[first_pos])
+        vehicle2.vehicle_route.insert_node(second_pos + 1, vehicle1.vehicle_route.get_node_from_position(first_pos))
         if vehicle1 == vehicle2 and first_pos > second_pos:
             # in case of intra-route relocations, when we relocate behind, we have to delete the index +1
-            del vehicle1.vehicle_route.node_sequence[first_pos + 1]
+            vehicle1.vehicle_route.remove_node(first_pos + 1)
         else:
-            del vehicle1.vehicle_route.node_sequence[first_pos]
+            vehicle1.vehicle_route.remove_node(first_pos)
 
     def __repr__(self):
         return "Relocation Move"
 
 
 class TwoOptOptimizer(Optimizer):
-    def __init__(self, solution: Solution):
-        self.solution = solution
-        self.run_again = True
-        self.beneficial_moves: List[OptimizerMove] = []
-
     def run(self):
         c = 0
         self.run_again = True
@@ -364,7 +629,10 @@ class TwoOptOptimizer(Optimizer):
         return c
 
     def generate_solution_space(self, distances: DistanceType = DistanceType.NORMAL):
-        self.distances = distances  # Set Distances
+        self.start_scan(distances)
+        if self.batched_scan:
+            self.generate_batched_solution_space()
+            return
 
         max_route_length = max(len(vehicle.vehicle_route.node_sequence) for vehicle in self.solution.map.vehicles)
         for vehicle1, vehicle2 in itertools.combinations_with_replacement(self.solution.map.vehicles, r=2):
@@ -375,11 +643,9 @@ class TwoOptOptimizer(Optimizer):
                                                  vehicle1=vehicle1,
                                                  vehicle2=vehicle2):
                     continue
+                self.scanned += 1
 
-                if first_pos == len(vehicle1.vehicle_route.node_sequence) - 1 and vehicle2 != vehicle1:
-                    continue  # Can't Do Two Opt for end of route
-
-                if vehicle1 == vehicle2 and second_pos - first_pos < 2:
+                if not self.allowed_move(first_pos, second_pos, vehicle1, vehicle2):
                     continue
 
                 if not self.capacity_check(first_pos=first_pos,
@@ -407,6 +673,133 @@ class TwoOptOptimizer(Optimizer):
                                   vehicle1_new_time=v1_time,
                                   vehicle2_new_time=v2_time)
                 )
+                if self.selection.done:
+                    return
+
+    def route_pairs(self):
+        return itertools.combinations_with_replacement(self.solution.map.vehicles, r=2)
+
+    def generate_granular_positions(self, route_arrays: Dict[Vehicle, RouteArrays]):
+        """Moves that link the customer to its neighbour, either as swap_node1-swap_node2 or as d-c (c-f inside a route)"""
+        customer_route, customer_pos, neighbor_route, neighbor_pos = self.locate_candidate_pairs(route_arrays)
+
+        # vehicle pairs are visited as combinations, so the end on the earlier vehicle (or position) comes first
+        customer_first = (customer_route < neighbor_route) | \
+                         ((customer_route == neighbor_route) & (customer_pos < neighbor_pos))
+        route1 = np.where(customer_first, customer_route, neighbor_route)
+        pos1 = np.where(customer_first, customer_pos, neighbor_pos)
+        route2 = np.where(customer_first, neighbor_route, customer_route)
+        pos2 = np.where(customer_first, neighbor_pos, customer_pos)
+        second_shift = np.where(route1 == route2, -1, 1)
+
+        return self.group_by_route_pair(route1=np.concatenate((route1, route1)),
+                                        first_pos=np.concatenate((pos1, pos1 - 1)),
+                                        route2=np.concatenate((route2, route2)),
+                                        second_pos=np.concatenate((pos2, pos2 + second_shift)))
+
+    def evaluate_route_pair(self, vehicle1: Vehicle, vehicle2: Vehicle, route_arrays: Dict[Vehicle, RouteArrays],
+                            first_pos: Optional[np.ndarray] = None,
+                            second_pos: Optional[np.ndarray] = None) -> CandidateBatch:
+        time_distances_vehicle1, time_distances_vehicle2 = self.determine_time_matrix(vehicle1, vehicle2)
+
+        return self.evaluate_two_opts(route1=route_arrays[vehicle1],
+                                      route2=route_arrays[vehicle2],
+                                      same_route=vehicle1 == vehicle2,
+                                      distances=self.determine_distance_matrix(),
+                                      time_distances_vehicle1=time_distances_vehicle1,
+                                      time_distances_vehicle2=time_distances_vehicle2,
+                                      other_vehicles_time=self.determine_other_vehicles_time(vehicle1, vehicle2),
+                                      solution_time=self.solution.solution_time,
+                                      first_pos=first_pos,
+                                      second_pos=second_pos)
+
+    @staticmethod
+    def evaluate_two_opts(route1: RouteArrays,
+                          route2: RouteArrays,
+                          same_route: bool,
+                          distances: np.ndarray,
+                          time_distances_vehicle1: np.ndarray,
+                          time_distances_vehicle2: np.ndarray,
+                          other_vehicles_time: float,
+                          solution_time: float,
+                          first_pos: Optional[np.ndarray] = None,
+                          second_pos: Optional[np.ndarray] = None) -> CandidateBatch:
+        """
+        Array version of the scalar scan for one route pair, returns the feasible moves.
+        Intra-route moves reverse the segment after first_pos up to second_pos, inter-route moves exchange
+        the tails after first_pos and from second_pos on. New route times and loads of the tail exchange
+        come straight from the cumulative time and demand prefix arrays.
+        Without candidate positions every position pair is evaluated.
+        """
+        smallest_route = min(len(route1.ids), len(route2.ids))
+        if first_pos is None:
+            positions = np.arange(1, smallest_route)
+            first_pos, second_pos = (grid.ravel() for grid in np.meshgrid(positions, positions, indexing='ij'))
+
+        # same bounds as feasible_combination
+        keep = (first_pos >= 1) & (second_pos >= 1) & (np.maximum(first_pos, second_pos) < smallest_route)
+        first_pos, second_pos = first_pos[keep], second_pos[keep]
+        examined = len(first_pos)
+
+        if same_route:  # same rules as allowed_move, then capacity_check
+            keep = second_pos - first_pos >= 2
+        else:
+            keep = first_pos != len(route1.ids) - 1  # Can't Do Two Opt for end of route
+            new_route_load1 = route1.cumul_demand[first_pos] + route2.cumul_demand[-1] - \
+                route2.cumul_demand[second_pos - 1]
+            new_route_load2 = route2.cumul_demand[second_pos - 1] + route1.cumul_demand[-1] - \
+                route1.cumul_demand[first_pos]
+            keep &= (new_route_load1 <= route1.capacity) & (new_route_load2 <= route2.capacity)
+        first_pos, second_pos = first_pos[keep], second_pos[keep]
+
+        swap_node1, c = route1.ids[first_pos], route1.next_ids[first_pos]
+        d, swap_node2, f = route2.previous_ids[second_pos], route2.ids[second_pos], route2.next_ids[second_pos]
+        cumul1, cumul2 = route1.cumul_time, route2.cumul_time
+
+        if same_route:
+            swap_node2_last = swap_node2 == f
+
+            cost_added = distances[swap_node1, swap_node2] + distances[c, f]
+            cost_added -= np.where(swap_node2_last, distances[c, f], 0)
+            cost_removed = distances[swap_node1, c] + distances[swap_node2, f]
+
+            time_added_vehicle1 = time_distances_vehicle1[swap_node1, swap_node2]
+            time_added_vehicle1 += time_distances_vehicle1[c, f]
+            time_removed_vehicle1 = time_distances_vehicle1[swap_node1, c]
+            time_removed_vehicle1 += time_distances_vehicle1[swap_node2, f]
+            time_added_vehicle1 -= np.where(swap_node2_last, time_distances_vehicle1[c, f], 0)
+
+            vehicle1_new_time = cumul1[-1] + time_added_vehicle1 - time_removed_vehicle1
+            vehicle2_new_time = vehicle1_new_time
+        else:
+            cost_removed = distances[swap_node1, c] + distances[d, swap_node2]
+            cost_added = distances[d, c] + distances[swap_node1, swap_node2]
+
+            vehicle1_new_time = cumul1[first_pos]
+            vehicle1_new_time += time_distances_vehicle1[swap_node1, swap_node2]
+            vehicle1_new_time += cumul2[-1] - cumul2[second_pos]
+
+            vehicle2_new_time = cumul2[second_pos - 1]
+            vehicle2_new_time += time_distances_vehicle2[d, c]
+            vehicle2_new_time += cumul1[-1] - cumul1[first_pos + 1]
+
+        new_solution_time = np.maximum(np.maximum(vehicle1_new_time, vehicle2_new_time), other_vehicles_time)
+
+        return CandidateBatch(first_pos=first_pos,
+                              second_pos=second_pos,
+                              distance_cost=cost_added - cost_removed,
+                              time_cost=new_solution_time - solution_time,
+                              vehicle1_new_time=vehicle1_new_time,
+                              vehicle2_new_time=vehicle2_new_time,
+                              examined=examined)
+
+    pair_evaluator = evaluate_two_opts  # run by the worker processes of a pool
+
+    @staticmethod
+    def allowed_move(first_pos: int, second_pos: int, vehicle1: Vehicle, vehicle2: Vehicle) -> bool:
+        if vehicle1 == vehicle2:
+            return second_pos - first_pos >= 2
+        return first_pos != len(vehicle1.vehicle_route.node_sequence) - 1  # Can't Do Two Opt for end of route
 
     def capacity_check(self, first_pos: int, second_pos: int, vehicle1: Vehicle, vehicle2: Vehicle):
 
@@ -435,21 +828,21 @@ class TwoOptOptimizer(Optimizer):
         # we gain d-c swap_node1-swap_node2
 
         if vehicle1 == vehicle2:
-            cost_added = distances.get(swap_node1).get(swap_node2)
-            cost_added += distances.get(c).get(f)
+            cost_added = distances[swap_node1.id, swap_node2.id]
+            cost_added += distances[c.id, f.id]
 
-            cost_removed = distances.get(swap_node1).get(c)
-            cost_removed += distances.get(swap_node2).get(f)
+            cost_removed = distances[swap_node1.id, c.id]
+            cost_removed += distances[swap_node2.id, f.id]
 
             if swap_node2 == f:
-                cost_added -= distances.get(c).get(f)
+                cost_added -= distances[c.id, f.id]
 
         else:
-            cost_removed = distances.get(swap_node1).get(c)
-            cost_removed += distances.get(d).get(swap_node2)
+            cost_removed = distances[swap_node1.id, c.id]
+            cost_removed += distances[d.id, swap_node2.id]
 
-            cost_added = distances.get(d).get(c)
-            cost_added += distances.get(swap_node1).get(swap_node2)
+            cost_added = distances[d.id, c.id]
+            cost_added += distances[swap_node1.id, swap_node2.id]
 
         return cost_removed, cost_added
 
@@ -465,14 +858,14 @@ class TwoOptOptimizer(Optimizer):
         cumul1, cumul2 = self.determine_cumuls_costs(vehicle1, vehicle2)
 
         if vehicle1 == vehicle2:
-            time_added_vehicle1 = time_distances_vehicle1.get(swap_node1).get(swap_node2)
-            time_added_vehicle1 += time_distances_vehicle1.get(c).get(f)
+            time_added_vehicle1 = time_distances_vehicle1[swap_node1.id, swap_node2.id]
+            time_added_vehicle1 += time_distances_vehicle1[c.id, f.id]
 
-            time_removed_vehicle1 = time_distances_vehicle1.get(swap_node1).get(c)
-            time_removed_vehicle1 += time_distances_vehicle1.get(swap_node2).get(f)
+            time_removed_vehicle1 = time_distances_vehicle1[swap_node1.id, c.id]
+            time_removed_vehicle1 += time_distances_vehicle1[swap_node2.id, f.id]
 
             if swap_node2 == f:
-                time_added_vehicle1 -= time_distances_vehicle1.get(c).get(f)
+                time_added_vehicle1 -= time_distances_vehicle1[c.id, f.id]
 
             vehicle1_new_time = cumul1[-1] + time_added_vehicle1 - time_removed_vehicle1
             vehicle2_new_time = vehicle1_new_time
@@ -482,11 +875,11 @@ class TwoOptOptimizer(Optimizer):
 
         else:
             vehicle1_new_time = cumul1[first_pos]
-            vehicle1_new_time += time_distances_vehicle1.get(swap_node1).get(swap_node2)
+            vehicle1_new_time += time_distances_vehicle1[swap_node1.id, swap_node2.id]
             vehicle1_new_time += cumul2[-1] - cumul2[second_pos]
 
             vehicle2_new_time = cumul2[second_pos - 1]
-            vehicle2_new_time += time_distances_vehicle2.get(d).get(c)
+            vehicle2_new_time += time_distances_vehicle2[d.id, c.id]
             vehicle2_new_time += cumul1[-1] - cumul1[first_pos + 1]
 
             new_solution_time = self.determine_new_solution_time((vehicle1, vehicle1_new_time),
@@ -498,9 +891,7 @@ class TwoOptOptimizer(Optimizer):
         """Apply TwoOpt Move"""
 
         if vehicle1 == vehicle2:
-            reversed_segment = reversed(vehicle1.vehicle_route.node_sequence[first_pos + 1:second_pos + 1])
-
-            vehicle1.vehicle_route.node_sequence[first_pos + 1: second_pos + 1] = reversed_segment
+            vehicle1.vehicle_route.reverse_segment(first_pos + 1, second_pos + 1)
         else:
 
             temp = vehicle1.vehicle_route.node_sequence.copy()  # Keep this because swapping elements changes list
@@ -508,11 +899,8 @@ class TwoOptOptimizer(Optimizer):
             # print(vehicle1.vehicle_route, end=',')
             # print(vehicle2.vehicle_route)
 
-            vehicle1.vehicle_route.node_sequence = vehicle1.vehicle_route.node_sequence[:first_pos + 1] + \
-                                                   vehicle2.vehicle_route.node_sequence[second_pos:]
-
-            vehicle2.vehicle_route.node_sequence = vehicle2.vehicle_route.node_sequence[:second_pos] + \
-                                                   temp[first_pos + 1:]
+            vehicle1.vehicle_route.replace_tail(first_pos + 1, vehicle2.vehicle_route.node_sequence[second_pos:])
+            vehicle2.vehicle_route.replace_tail(second_pos, temp[first_pos + 1:])
 
             # print('twoOpt Result')
             # print(vehicle1.vehicle_route, end=',')
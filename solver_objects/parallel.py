@@ -0,0 +1,206 @@
+import inspect
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from map_objects.mapmanager import MapManager
+from map_objects.matrices import Profile, PenaltyOverlay, PenalizedTimeMatrix
+from solver_objects.move import CandidateBatch, DistanceType, RouteArrays
+
+
+@dataclass
+class PairJob:
+    """One vehicle pair to evaluate, vehicles are referred to by their index in the vehicle list"""
+    pair_index: int
+    vehicle1: int
+    vehicle2: int
+    profile1: Profile
+    profile2: Profile
+    other_vehicles_time: float
+    first_pos: Optional[np.ndarray]
+    second_pos: Optional[np.ndarray]
+
+
+@dataclass
+class ChunkTask:
+    """Consecutive vehicle pairs evaluated by one worker, with the routes they need"""
+    evaluator: Callable[..., CandidateBatch]
+    uses_demands: bool
+    penalized: bool
+    solution_time: float
+    first_penalty_version: int
+    penalties: List[Tuple[int, int, int, float]]  # penalties applied since first_penalty_version
+    routes: Dict[int, RouteArrays]
+    jobs: List[PairJob]
+
+
+@dataclass
+class ChunkResult:
+    """Cheapest improving moves of a chunk, ties between pairs are all kept"""
+    worker: int
+    penalty_version: int
+    examined: int  # candidates of every pair in the chunk
+    best_cost: float
+    batches: List[Tuple[int, CandidateBatch]]
+
+
+_worker = {}  # matrices of the worker process, set once by the pool initializer
+
+
+def _initialize_worker(distance_matrix: np.ndarray,
+                       penalized_distance_matrix: np.ndarray,
+                       time_matrices: Dict[Profile, np.ndarray],
+                       penalized_time_matrices: List[PenalizedTimeMatrix],
+                       penalties: PenaltyOverlay,
+                       demands: np.ndarray,
+                       penalty_version: int):
+    # the overlay arrives with the penalized matrices it keeps in sync, as one set of initargs
+    _worker['distance_matrix'] = distance_matrix
+    _worker['penalized_distance_matrix'] = penalized_distance_matrix
+    _worker['time_matrices'] = time_matrices
+    _worker['penalized_time_matrices'] = penalized_time_matrices
+    _worker['penalties'] = penalties
+    _worker['demands'] = demands
+    _worker['penalty_version'] = penalty_version
+
+
+def _apply_penalties(first_version: int, penalties: List[Tuple[int, int, int, float]]):
+    """Same updates as MapManager.penalize_arc, skipping the ones this worker has already applied"""
+    for version, (vehicle_index, node1_id, node2_id, factor) in enumerate(penalties, start=first_version):
+        if version < _worker['penalty_version']:
+            continue
+        _worker['penalties'].penalize(node1_id, node2_id, factor)
+        _worker['penalized_time_matrices'][vehicle_index].penalize(node1_id, node2_id, factor)
+        _worker['penalty_version'] = version + 1
+
+
+def _evaluate_chunk(task: ChunkTask) -> ChunkResult:
+    _apply_penalties(task.first_penalty_version, task.penalties)
+    distances = _worker['penalized_distance_matrix' if task.penalized else 'distance_matrix']
+
+    examined = 0
+    best_cost = np.inf
+    best_batches = []
+    for job in task.jobs:
+        if task.penalized:  # penalized times are per vehicle, real times per profile
+            time_matrix1 = _worker['penalized_time_matrices'][job.vehicle1]
+            time_matrix2 = _worker['penalized_time_matrices'][job.vehicle2]
+        else:
+            time_matrix1, time_matrix2 = _worker['time_matrices'][job.profile1], _worker['time_matrices'][job.profile2]
+        arguments = dict(route1=task.routes[job.vehicle1],
+                         route2=task.routes[job.vehicle2],
+                         same_route=job.vehicle1 == job.vehicle2,
+                         distances=distances,
+                         time_distances_vehicle1=time_matrix1,
+                         time_distances_vehicle2=time_matrix2,
+                         other_vehicles_time=job.other_vehicles_time,
+                         solution_time=task.solution_time,
+                         first_pos=job.first_pos,
+                         second_pos=job.second_pos)
+        if task.uses_demands:
+            arguments['demands'] = _worker['demands']
+
+        batch = task.evaluator(**arguments)
+        examined += batch.examined
+        batch = batch.improving()
+        if not len(batch):
+            continue
+        move_costs = batch.move_cost()
+        pair_cost = move_costs.min()
+        if pair_cost < best_cost:
+            best_cost = pair_cost
+            best_batches = []
+        if pair_cost == best_cost:
+            best_batches.append((job.pair_index, batch.select(move_costs == pair_cost)))
+
+    return ChunkResult(worker=os.getpid(),
+                       penalty_version=_worker['penalty_version'],
+                       examined=examined,
+                       best_cost=best_cost,
+                       batches=best_batches)
+
+
+class EvaluationPool:
+    """
+    Persistent worker processes that evaluate vehicle pairs with the static batched evaluators.
+    Workers receive the matrices once when they start, afterwards a scan only sends route arrays
+    and the penalties applied since the oldest penalty version a worker may still hold.
+    Every worker returns the cheapest moves of its pairs, so the pool only serves best improvement.
+    """
+
+    def __init__(self, node_map: MapManager, workers: int, chunks_per_worker: int = 4):
+        self.map = node_map
+        self.workers = workers
+        self.chunks_per_worker = chunks_per_worker
+        self.initial_penalty_version = node_map.penalty_version
+        self.worker_penalty_versions: Dict[int, int] = {}
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            initializer=_initialize_worker,
+                                            initargs=(node_map.distance_matrix,
+                                                      node_map.penalized_distance_matrix,
+                                                      node_map.time_matrices.time_matrices,
+                                                      [vehicle.penalized_time_matrix for vehicle in node_map.vehicles],
+                                                      node_map.penalties,
+                                                      node_map.demands,
+                                                      node_map.penalty_version))
+
+    def evaluate(self,
+                 evaluator: Callable[..., CandidateBatch],
+                 distances: DistanceType,
+                 solution_time: float,
+                 route_arrays: List[RouteArrays],
+                 jobs: List[PairJob]) -> Tuple[List[Tuple[int, CandidateBatch]], int]:
+        """
+        Cheapest improving moves over every job, as (pair index, batch) in pair order,
+        and the number of candidates the workers examined.
+        Keeping every tie lets the caller break them in scan order, exactly like the serial scan.
+        """
+        if not jobs:
+            return [], 0
+
+        first_penalty_version = self.oldest_penalty_version()
+        penalties = self.map.penalty_log[first_penalty_version:]
+        uses_demands = 'demands' in inspect.signature(evaluator).parameters
+
+        tasks = []
+        for chunk in np.array_split(np.arange(len(jobs)), min(len(jobs), self.workers * self.chunks_per_worker)):
+            chunk_jobs = [jobs[i] for i in chunk]
+            vehicles = {job.vehicle1 for job in chunk_jobs} | {job.vehicle2 for job in chunk_jobs}
+            tasks.append(ChunkTask(evaluator=evaluator,
+                                   uses_demands=uses_demands,
+                                   penalized=distances == DistanceType.PENALIZED,
+                                   solution_time=solution_time,
+                                   first_penalty_version=first_penalty_version,
+                                   penalties=penalties,
+                                   routes={vehicle: route_arrays[vehicle] for vehicle in vehicles},
+                                   jobs=chunk_jobs))
+
+        results = list(self.executor.map(_evaluate_chunk, tasks))
+        for result in results:
+            self.worker_penalty_versions[result.worker] = result.penalty_version
+
+        examined = sum(result.examined for result in results)
+        best_cost = min(result.best_cost for result in results)
+        if best_cost == np.inf:
+            return [], examined
+        # chunks hold consecutive pairs, so results come back in pair order
+        return [pair for result in results if result.best_cost == best_cost for pair in result.batches], examined
+
+    def oldest_penalty_version(self) -> int:
+        """Workers that have not reported back yet still hold the penalties the pool started with"""
+        versions = list(self.worker_penalty_versions.values())
+        if len(versions) < self.workers:
+            versions.append(self.initial_penalty_version)
+        return min(versions)
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,159 @@
+import json
+import time
+from dataclasses import dataclass, asdict
+from functools import wraps
+from typing import Dict, Optional
+
+import numpy as np
+
+
+@dataclass
+class OperatorCounters:
+    """
+    Hot path counters of one operator. Candidates are the position pairs of the scan that lie inside both routes,
+    rejected the ones dropped by the rules of the move type or the capacity check. The scalar scan and the batched
+    evaluators apply the same filters, so both count the same numbers. Vehicle pairs served from the move cache
+    are not evaluated again and add no candidates. Scans evaluated in a pool only count scans, improving moves
+    and time, the candidates are evaluated in the worker processes.
+    """
+    scans: int = 0
+    scan_seconds: float = 0.0
+    candidates: int = 0
+    rejected: int = 0
+    improving: int = 0
+    applied: int = 0
+    apply_seconds: float = 0.0
+
+
+@dataclass
+class CombinerCounters:
+    runs: int = 0
+    run_seconds: float = 0.0
+    iterations: int = 0
+    penalizations: int = 0
+    penalize_seconds: float = 0.0
+
+
+class Profiler:
+    """
+    Counters of the optimizers and combiners it is attached to, reported as JSON at the end of a run.
+    Attaching wraps the counted methods of that instance only, so a run without a profiler executes
+    exactly the code it did before and pays nothing for the counters.
+    """
+
+    def __init__(self):
+        self.operators: Dict[str, OperatorCounters] = {}
+        self.combiners: Dict[str, CombinerCounters] = {}
+
+    def attach(self, optimizer):
+        """Count the scans, candidates and applied moves of an optimizer, per operator class"""
+        counters = self.operators.setdefault(type(optimizer).__name__, OperatorCounters())
+
+        def timed(method, count: str, seconds: str):
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    setattr(counters, seconds, getattr(counters, seconds) + time.perf_counter() - start_time)
+                    setattr(counters, count, getattr(counters, count) + 1)
+            return wrapper
+
+        feasible_combination = optimizer.feasible_combination
+        allowed_move = optimizer.allowed_move
+        capacity_check = optimizer.capacity_check
+        evaluate_route_pair = optimizer.evaluate_route_pair
+        handle_move = optimizer.handle_move
+        handle_moves = optimizer.handle_moves
+
+        # scalar scan: feasible_combination keeps the pairs inside both routes, allowed_move and capacity_check filter
+        def count_feasible_combination(*args, **kwargs):
+            feasible = feasible_combination(*args, **kwargs)
+            counters.candidates += feasible
+            return feasible
+
+        def count_allowed_move(*args, **kwargs):
+            allowed = allowed_move(*args, **kwargs)
+            counters.rejected += not allowed
+            return allowed
+
+        def count_capacity_check(*args, **kwargs):
+            feasible = capacity_check(*args, **kwargs)
+            counters.rejected += not feasible
+            return feasible
+
+        # batched scan: the evaluators report the position pairs they examined
+        def count_evaluate_route_pair(*args, **kwargs):
+            batch = evaluate_route_pair(*args, **kwargs)
+            counters.candidates += batch.examined
+            counters.rejected += batch.rejected
+            return batch
+
+        in_batch = [False]  # handle_moves of the tabu searches hands every row to handle_move again
+
+        def count_handle_move(move):
+            if not in_batch[0]:
+                counters.improving += int(move.move_cost < 0)
+            return handle_move(move)
+
+        def count_handle_moves(move_costs: np.ndarray, materialize):
+            counters.improving += len(move_costs)  # only improving rows get here
+            in_batch[0] = True
+            try:
+                return handle_moves(move_costs, materialize)
+            finally:
+                in_batch[0] = False
+
+        optimizer.feasible_combination = count_feasible_combination
+        optimizer.allowed_move = count_allowed_move
+        optimizer.capacity_check = count_capacity_check
+        optimizer.evaluate_route_pair = count_evaluate_route_pair
+        optimizer.handle_move = count_handle_move
+        optimizer.handle_moves = count_handle_moves
+        optimizer.generate_solution_space = timed(optimizer.generate_solution_space, 'scans', 'scan_seconds')
+        optimizer.apply_best_move = timed(optimizer.apply_best_move, 'applied', 'apply_seconds')
+
+    def attach_combiner(self, combiner):
+        """Count the runs, iterations and penalizations of a combiner, per combiner class"""
+        counters = self.combiners.setdefault(type(combiner).__name__, CombinerCounters())
+        run = combiner.run
+        record_iteration = combiner.record_iteration
+
+        @wraps(run)
+        def count_run(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return run(*args, **kwargs)
+            finally:
+                counters.run_seconds += time.perf_counter() - start_time
+                counters.runs += 1
+
+        def count_record_iteration():
+            counters.iterations += 1
+            record_iteration()
+
+        combiner.run = count_run
+        combiner.record_iteration = count_record_iteration
+        if hasattr(combiner, 'penalize_arcs'):
+            penalize_arcs = combiner.penalize_arcs
+
+            def count_penalize_arcs():
+                start_time = time.perf_counter()
+                penalize_arcs()
+                counters.penalize_seconds += time.perf_counter() - start_time
+                counters.penalizations += 1
+
+            combiner.penalize_arcs = count_penalize_arcs
+
+    def report(self) -> dict:
+        return {'operators': {name: asdict(counters) for name, counters in self.operators.items()},
+                'combiners': {name: asdict(counters) for name, counters in self.combiners.items()}}
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """JSON report, also written to path when given"""
+        report = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(report)
+        return report
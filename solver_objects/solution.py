@@ -1,20 +1,128 @@
 import math
-from typing import Tuple
+from dataclasses import dataclass
+from typing import Tuple, List, Dict
+
+import numpy as np
+
 from map_objects.mapmanager import MapManager
-from map_objects.node import Node, Vehicle
+from map_objects.node import Node, Route, Vehicle
 
 
 def compute_node_distance(node1: Node, node2: Node) -> float:
     return math.sqrt((node1.x_cord - node2.x_cord) ** 2 + (node1.y_cord - node2.y_cord) ** 2)
 
 
+class MakespanTracker:
+    """
+    Indexed max-heap of vehicle times. Updating a vehicle costs O(log V) and the slowest time among
+    the vehicles a move does not touch is read off the top of the heap, without copying any times.
+    """
+
+    def __init__(self):
+        self.heap: List[Vehicle] = []
+        self.times: Dict[Vehicle, float] = {}
+        self.position: Dict[Vehicle, int] = {}
+
+    def update(self, vehicle: Vehicle, time: float):
+        if vehicle not in self.position:
+            self.heap.append(vehicle)
+            self.position[vehicle] = len(self.heap) - 1
+            self.times[vehicle] = time
+            self._sift_up(len(self.heap) - 1)
+            return
+
+        old_time = self.times[vehicle]
+        self.times[vehicle] = time
+        if time > old_time:
+            self._sift_up(self.position[vehicle])
+        elif time < old_time:
+            self._sift_down(self.position[vehicle])
+
+    def max_time(self) -> float:
+        return self.times[self.heap[0]]
+
+    def slowest(self) -> Vehicle:
+        return self.heap[0]
+
+    def max_excluding(self, *vehicles: Vehicle) -> float:
+        """Slowest time among the vehicles not given, -inf if there are none"""
+        if not self.heap:
+            return -math.inf
+        if self.heap[0] not in vehicles:  # the usual case, the slowest vehicle is not part of the move
+            return self.times[self.heap[0]]
+
+        frontier = [0]
+        while frontier:
+            best = max(frontier, key=lambda index: self.times[self.heap[index]])
+            if self.heap[best] not in vehicles:
+                return self.times[self.heap[best]]
+            # an excluded vehicle, the next slowest is one of its children or already in the frontier
+            frontier.remove(best)
+            frontier.extend(child for child in (2 * best + 1, 2 * best + 2) if child < len(self.heap))
+        return -math.inf
+
+    def max_with(self, *args: Tuple[Vehicle, float]) -> float:
+        """Slowest time if the given vehicles took the given times"""
+        new_max = self.max_excluding(*[vehicle for vehicle, _ in args])
+        for _, time in args:
+            if time > new_max:
+                new_max = time
+        return new_max
+
+    def _swap(self, i: int, j: int):
+        self.heap[i], self.heap[j] = self.heap[j], self.heap[i]
+        self.position[self.heap[i]] = i
+        self.position[self.heap[j]] = j
+
+    def _sift_up(self, index: int):
+        while index > 0:
+            parent = (index - 1) // 2
+            if self.times[self.heap[index]] <= self.times[self.heap[parent]]:
+                return
+            self._swap(index, parent)
+            index = parent
+
+    def _sift_down(self, index: int):
+        while True:
+            largest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self.heap) and self.times[self.heap[child]] > self.times[self.heap[largest]]:
+                    largest = child
+            if largest == index:
+                return
+            self._swap(index, largest)
+            index = largest
+
+
+@dataclass
+class SolutionSnapshot:
+    """Routes of a solution as node id arrays in vehicle order, with the times they had when captured"""
+    routes: List[np.ndarray]
+    route_objects: List[Route]  # route and version of every vehicle, lets restore skip the routes that did not change
+    route_versions: List[int]
+    vehicle_times: List[float]
+    solution_time: float
+
+    @classmethod
+    def from_routes(cls, routes: List[np.ndarray], vehicle_times: List[float], solution_time: float):
+        """Snapshot not taken from live routes, restoring it rewrites every route"""
+        return cls(routes=routes,
+                   route_objects=[None] * len(routes),
+                   route_versions=[-1] * len(routes),
+                   vehicle_times=vehicle_times,
+                   solution_time=solution_time)
+
+
 class Solution:
 
-    def __init__(self, Map: MapManager):
+    def __init__(self, Map: MapManager, cross_check: bool = False):
         self.map = Map
+        self.cross_check = cross_check  # compare every incremental time update with a full recompute
         self.solution_time: float
         self.vehicle_times: dict[Vehicle, float] = {}
         self.penalized_vehicle_times: dict[Vehicle, float] = {}
+        self.makespan = MakespanTracker()
+        self.penalized_makespan = MakespanTracker()
         self.solution_time, self.slowest_vehicle = self.compute_service_time()  # update self.solution_time and slowest_vehicle
 
     def compute_service_time(self) -> Tuple[float, Vehicle]:
@@ -24,6 +132,8 @@ class Solution:
             penalized_time = self.compute_penalized_route_time(vehicle)
             self.vehicle_times.update({vehicle: time})
             self.penalized_vehicle_times.update({vehicle: penalized_time})
+            self.makespan.update(vehicle, time)
+            self.penalized_makespan.update(vehicle, penalized_time)
 
         slowest_vehicle = max(self.vehicle_times, key=lambda x: self.vehicle_times.get(x))
 
@@ -31,13 +141,61 @@ class Solution:
         self.solution_time = self.vehicle_times.get(slowest_vehicle)
         return max_time, slowest_vehicle
 
-    def update_service_time_from_cache(self, *args: Tuple[Vehicle, float]):
-        """Set new solution time by updates cached route times"""
-        for vehicle, time in args:
+    def update_service_time_from_cache(self, *vehicles: Vehicle):
+        """
+        Set new solution time from the cached route times of the given vehicles, the other vehicles are unchanged.
+        Routes keep their cumulative times up to date, so the route times are their last entries.
+        """
+        for vehicle in vehicles:
+            time = vehicle.vehicle_route.cumul_time_cost[-1]
+            penalized_time = vehicle.vehicle_route.penalized_cumul_time_cost[-1]
             self.vehicle_times.update({vehicle: time})
-        self.slowest_vehicle = max(self.vehicle_times, key=lambda x: self.vehicle_times.get(x))
+            self.penalized_vehicle_times.update({vehicle: penalized_time})
+            self.makespan.update(vehicle, time)
+            self.penalized_makespan.update(vehicle, penalized_time)
+        self.slowest_vehicle = self.makespan.slowest()
         self.solution_time = self.vehicle_times.get(self.slowest_vehicle)
 
+        if self.cross_check:
+            self.check_service_time()
+
+    def check_service_time(self) -> None:
+        """Check the incrementally kept times against a full recompute"""
+        for vehicle in self.map.vehicles:
+            time = self.compute_route_time(vehicle)
+            penalized_time = self.compute_penalized_route_time(vehicle)
+            if self.vehicle_times.get(vehicle) != time or self.penalized_vehicle_times.get(vehicle) != penalized_time:
+                raise ValueError(f"Vehicle {vehicle} has cached times {self.vehicle_times.get(vehicle)}, "
+                                 f"{self.penalized_vehicle_times.get(vehicle)} but its route takes {time}, "
+                                 f"{penalized_time}")
+        if self.solution_time != max(self.vehicle_times.values()) or \
+                self.penalized_makespan.max_time() != max(self.penalized_vehicle_times.values()):
+            raise ValueError(f"Solution time {self.solution_time} does not match the route times")
+
+    def snapshot(self) -> SolutionSnapshot:
+        """Capture the routes in O(N), no node or matrix is copied"""
+        vehicles = self.map.vehicles
+        return SolutionSnapshot(
+            routes=[np.fromiter((node.id for node in vehicle.vehicle_route.node_sequence), dtype=np.intp,
+                                count=len(vehicle.vehicle_route.node_sequence)) for vehicle in vehicles],
+            route_objects=[vehicle.vehicle_route for vehicle in vehicles],
+            route_versions=[vehicle.vehicle_route.version for vehicle in vehicles],
+            vehicle_times=[self.vehicle_times.get(vehicle) for vehicle in vehicles],
+            solution_time=self.solution_time)
+
+    def restore(self, snapshot: SolutionSnapshot):
+        """Put back the routes of a snapshot, routes unchanged since it was captured are left as they are"""
+        changed = []
+        for k, vehicle in enumerate(self.map.vehicles):
+            route = vehicle.vehicle_route
+            if route is snapshot.route_objects[k] and route.version == snapshot.route_versions[k]:
+                continue
+            route.replace_tail(1, [self.map.nodes[node_id] for node_id in snapshot.routes[k][1:]])
+            vehicle.update_cumul_time_cost()
+            vehicle.update_position()
+            changed.append(vehicle)
+        self.update_service_time_from_cache(*changed)
+
     @staticmethod
     def compute_route_time(vehicle: Vehicle) -> float:
         time_to_travel: float = 0
@@ -45,7 +203,7 @@ class Solution:
             starting_node = vehicle.vehicle_route.node_sequence[i]
             destination_node = vehicle.vehicle_route.node_sequence[i + 1]
 
-            time_to_travel += vehicle.time_matrix.get(starting_node).get(destination_node)
+            time_to_travel += vehicle.time_matrix[starting_node.id, destination_node.id]
 
         return time_to_travel
 
@@ -56,7 +214,7 @@ class Solution:
             starting_node = vehicle.vehicle_route.node_sequence[i]
             destination_node = vehicle.vehicle_route.node_sequence[i + 1]
 
-            time_to_travel += vehicle.penalized_time_matrix.get(starting_node).get(destination_node)
+            time_to_travel += vehicle.penalized_time_matrix[starting_node.id, destination_node.id]
 
         return time_to_travel
 
@@ -66,11 +224,17 @@ class Solution:
             for i in range(len(vehicle.vehicle_route.node_sequence) - 1):
                 starting_node = vehicle.vehicle_route.node_sequence[i]
                 destination_node = vehicle.vehicle_route.node_sequence[i + 1]
-                tot_distance += self.map.distance_matrix.get(starting_node).get(destination_node)
+                tot_distance += self.map.get_distance(starting_node, destination_node)
         return tot_distance
 
     def check_capacity(self) -> None:
         """check all routes capacity"""
+        for vehicle in self.map.vehicles:
+            route_demand = sum(node.demand for node in vehicle.vehicle_route.node_sequence)
+            if route_demand != vehicle.vehicle_route.load:
+                raise ValueError(f"Vehicle {vehicle} has cached load {vehicle.vehicle_route.load} "
+                                 f"but its route demand is {route_demand}")
+
         if all(vehicle.vehicle_route.get_total_route_demand() <= vehicle.vehicle_capacity for vehicle in
                self.map.vehicles):
             print('all good with capacity')
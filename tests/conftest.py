@@ -0,0 +1,40 @@
+import contextlib
+import io
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from map_objects.mapmanager import MapManager
+from map_objects.node import Node, Vehicle
+from solver_objects.algorithm import MinimumInsertions
+from solver_objects.solution import Solution
+
+
+def build_solution(nodes: int = 60, vehicles: int = 8, seed: int = 5) -> Solution:
+    """MinimumInsertions solution of a small random instance, the same seed always gives the same solution"""
+    random.seed(seed)
+    home_depot = Node(_id=0, x_cord=50, y_cord=50, demand=0, unloading_time=15)
+    home_depot.has_been_visited = True
+    customers = [Node(_id=i, x_cord=random.randint(0, 100), y_cord=random.randint(0, 100),
+                      demand=100 * (1 + random.randint(1, 4)), unloading_time=15) for i in range(1, nodes + 1)]
+    fleet = [Vehicle(_id=i, vehicle_speed=40, vehicle_capacity=3000, home_depot=home_depot, unloading_time=15)
+             for i in range(1, vehicles + 1)]
+    node_map = MapManager(nodes=[home_depot] + customers, vehicles=fleet)
+
+    solution = Solution(node_map)
+    with contextlib.redirect_stdout(io.StringIO()):
+        MinimumInsertions(_map=node_map, solution=solution).run()
+    solution.compute_service_time()
+    return solution
+
+
+@pytest.fixture
+def quiet():
+    """The solvers print every step"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
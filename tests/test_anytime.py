@@ -0,0 +1,19 @@
+from conftest import build_solution
+from solver_objects.combiners import SwapTabuSearch, ReLocTabuSearchWithMemory
+
+
+def test_second_run_starts_with_fresh_stagnation(quiet):
+    search = SwapTabuSearch(build_solution(), limit=100, tabu_expander=5, stagnation_limit=3)
+    search.run()
+    assert search.stagnation >= 3
+    first_best = search.best_so_far()
+
+    search.run()
+    assert search.counter >= 3
+    assert search.best_so_far() is not first_best
+
+
+def test_tabu_search_with_memory_takes_the_stopping_rules(quiet):
+    search = ReLocTabuSearchWithMemory(build_solution(), limit=100, memory_limit=10, time_limit=0)
+    search.run()
+    assert search.counter == 0
@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import build_solution
+from solver_objects.move import DistanceType
+from solver_objects.OptimizerABC import TopK
+from solver_objects.optimizer import SwapMoveOptimizer, ReLocatorOptimizer, TwoOptOptimizer
+
+
+def penalize_arcs(solution):
+    """Penalize the first arc of every route on its own vehicle and, harder, on the next one, which does not hold it"""
+    node_map = solution.map
+    vehicles = node_map.vehicles
+    for vehicle, next_vehicle in zip(vehicles, vehicles[1:] + vehicles[:1]):
+        node1, node2 = vehicle.vehicle_route.node_sequence[1:3]
+        node_map.penalize_arc(node1, node2, 1.15, vehicle, vehicle.vehicle_route.find_arc(node1, node2))
+        node_map.penalize_arc(node1, node2, 1.3, next_vehicle, next_vehicle.vehicle_route.find_arc(node1, node2))
+    solution.update_service_time_from_cache(*vehicles)
+
+
+def scan(optimizer, distances):
+    optimizer.generate_solution_space(distances)
+    return [(move.vehicle1.id, move.vehicle2.id, move.first_pos, move.second_pos, move.distance_cost,
+             move.time_cost, move.vehicle1_new_time, move.vehicle2_new_time) for move in optimizer.selection.moves()]
+
+
+@pytest.mark.parametrize('operator', [SwapMoveOptimizer, ReLocatorOptimizer, TwoOptOptimizer])
+@pytest.mark.parametrize('distances', [DistanceType.NORMAL, DistanceType.PENALIZED])
+def test_batched_scan_finds_the_same_moves(operator, distances):
+    solution = build_solution()
+    penalize_arcs(solution)
+    scalar = operator(solution, selection=TopK(10 ** 6))
+    batched = operator(solution, selection=TopK(10 ** 6), batched=True)
+
+    scalar_moves = scan(scalar, distances)
+    assert scalar_moves
+    assert scalar_moves == scan(batched, distances)
@@ -0,0 +1,52 @@
+from conftest import build_solution
+from solver_objects.checkpoint import load_checkpoint
+from solver_objects.combiners import VNDGLS, AdaptiveOperatorSelection
+from solver_objects.optimizer import SwapMoveOptimizer, ReLocatorOptimizer, TwoOptOptimizer
+
+
+class RecordedSelection(AdaptiveOperatorSelection):
+    def __init__(self):
+        super().__init__()
+        self.picks = []
+
+    def choose(self, operators: int) -> int:
+        index = super().choose(operators)
+        self.picks.append(index)
+        return index
+
+
+def run_search(limit: int, checkpoint_path=None, checkpoint=None):
+    solution = build_solution()
+    selection = RecordedSelection()
+    search = VNDGLS(random_seed=1, limit=limit, solution=solution, operators=selection,
+                    checkpoint_path=checkpoint_path, checkpoint_every=50)
+    for operator in (SwapMoveOptimizer, ReLocatorOptimizer, TwoOptOptimizer):
+        search.add_pipeline(operator(solution, batched=True, cache_moves=True))
+    search.run(checkpoint)
+    routes = [[node.id for node in vehicle.vehicle_route.node_sequence] for vehicle in solution.map.vehicles]
+    return selection, solution.solution_time, routes
+
+
+def test_adaptive_selection_is_reproducible(quiet):
+    first_selection, first_time, first_routes = run_search(limit=300)
+    second_selection, second_time, second_routes = run_search(limit=300)
+
+    assert len(set(first_selection.picks)) > 1
+    assert first_selection.picks == second_selection.picks
+    assert first_selection.state() == second_selection.state()
+    assert first_time == second_time
+    assert first_routes == second_routes
+
+
+def test_adaptive_selection_resumes_like_the_uninterrupted_run(quiet, tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    straight_selection, straight_time, straight_routes = run_search(limit=150)
+    run_search(limit=120, checkpoint_path=path)  # last checkpoint at iteration 100
+
+    checkpoint = load_checkpoint(path)
+    assert checkpoint.iteration == 100
+    resumed_selection, resumed_time, resumed_routes = run_search(limit=150, checkpoint=checkpoint)
+
+    assert resumed_selection.picks == straight_selection.picks[100:]
+    assert resumed_time == straight_time
+    assert resumed_routes == straight_routes
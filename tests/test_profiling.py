@@ -0,0 +1,37 @@
+import pytest
+
+from conftest import build_solution
+from solver_objects.move import DistanceType
+from solver_objects.optimizer import SwapMoveOptimizer, ReLocatorOptimizer, TwoOptOptimizer
+from solver_objects.profiling import Profiler
+
+
+@pytest.mark.parametrize('operator', [SwapMoveOptimizer, ReLocatorOptimizer, TwoOptOptimizer])
+@pytest.mark.parametrize('distances', [DistanceType.NORMAL, DistanceType.PENALIZED])
+def test_scalar_and_batched_scans_count_the_same(operator, distances):
+    solution = build_solution()
+    counters = []
+    for batched in (False, True):
+        profiler = Profiler()
+        optimizer = operator(solution, batched=batched)
+        optimizer.enable_profiling(profiler)
+        optimizer.generate_solution_space(distances)
+        counters.append(profiler.operators[operator.__name__])
+
+    scalar, batched = counters
+    assert scalar.candidates > 0
+    assert (scalar.candidates, scalar.rejected, scalar.improving) == \
+           (batched.candidates, batched.rejected, batched.improving)
+
+
+def test_profiling_does_not_change_the_scan():
+    solution = build_solution()
+    moves = []
+    for profiled in (False, True):
+        optimizer = TwoOptOptimizer(solution, batched=True)
+        if profiled:
+            optimizer.enable_profiling(Profiler())
+        optimizer.generate_solution_space()
+        moves.append(optimizer.selection.best())
+    assert moves[0] == moves[1]
+    assert moves[0].move_cost == moves[1].move_cost